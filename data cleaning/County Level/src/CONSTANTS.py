@@ -1,5 +1,9 @@
 RAW_DATA_DIRECTORY = "../../data" # Add the path to the raw data folder here
 
+# Solar project size buckets, edges in MW (small < 5 <= medium < 25 <= large)
+SOLAR_SIZE_EDGES = (5, 25)
+SOLAR_SIZE_LABELS = ("small", "medium", "large")
+
 
 data_file_mappings_county_raw = {
     "Wind": "../projects/wind/ez_gis.plant_power_eia_v8_wind.shp",
@@ -16,6 +20,7 @@ data_file_mappings_county_raw = {
     'population_data': 'social factors/population_raw.csv',
     "NREL_Electric": "electric price/NREL_raw.csv",
     "EIA_Electric": "electric price/EIA_raw.csv",
+    "electric": "electric price/electric_raw(don't rememeber source).csv",
     "Rural_Urban": "electric price/rural_urban_raw.csv",
 }
 
@@ -28,6 +33,42 @@ data_file_mappings_county_clean = {
     "bounding_boxes": "county_bounding_boxes_full.csv",
 }
 
+# Block group tables from data.census.gov (national files, read in chunks by src/block_group.py)
+data_file_mappings_block_group_raw = {
+    "DEC_race_bg": "DECENNIALPL2020.P1-Data.csv",
+    "unemployment_bg": "ACSDT5Y2022.B23025-Data.csv",
+    "income_bg": "ACSDT5Y2022.B19013-Data.csv",
+}
+
+data_file_mappings_block_group_clean = {
+    "solar_bg": "solar_clean_bg.csv",
+    "bounding_boxes_bg": "bounding_box_full_bg.csv",
+}
+
+# Typed Parquet copies of the cleaned tables (partitioned by state FIPS), see src/store.py
+data_file_mappings_store = {
+    "social_factors_merged": "social_factors_merged.parquet",
+    "suitability_scores_county": "suitability_scores_county.parquet",
+    "suitability_scores_project": "suitability_scores_project.parquet",
+    "solar_clean_bg": "solar_clean_bg.parquet",
+    "solar_count_bg": "solar_count_bg.parquet",
+    "solar_mean_bg": "solar_mean_bg.parquet",
+    "solar_sum_bg": "solar_sum_bg.parquet",
+    "merged_data": "merged_data.parquet",
+}
+
+# CSV each stored table is converted from (relative to the raw data folder)
+data_file_mappings_store_sources = {
+    "social_factors_merged": "county_clean/social_factors_merged.csv",
+    "suitability_scores_county": "suitability_scores/suitability_scores_county.csv",
+    "suitability_scores_project": "suitability_scores/suitability_scores_project.csv",
+    "solar_clean_bg": "block_group_clean/solar_clean_bg.csv",
+    "solar_count_bg": "block_group_clean/solar_count_bg.csv",
+    "solar_mean_bg": "block_group_clean/solar_mean_bg.csv",
+    "solar_sum_bg": "block_group_clean/solar_sum_bg.csv",
+    "merged_data": "../regression/merged_data.csv",
+}
+
 
 def get_file_path(file_name):
     if file_name in data_file_mappings_county_raw:
@@ -36,3 +77,16 @@ def get_file_path(file_name):
         return f"{RAW_DATA_DIRECTORY}/extras/{data_file_mappings_extras[file_name]}"
     elif file_name in data_file_mappings_county_clean:
         return f"{RAW_DATA_DIRECTORY}/county_clean/{data_file_mappings_county_clean[file_name]}"
+    elif file_name in data_file_mappings_block_group_raw:
+        return f"{RAW_DATA_DIRECTORY}/block_group_raw/{data_file_mappings_block_group_raw[file_name]}"
+    elif file_name in data_file_mappings_block_group_clean:
+        return f"{RAW_DATA_DIRECTORY}/block_group_clean/{data_file_mappings_block_group_clean[file_name]}"
+    elif file_name in data_file_mappings_store:
+        return f"{RAW_DATA_DIRECTORY}/store/{data_file_mappings_store[file_name]}"
+
+
+def get_source_file_path(file_name):
+    """
+    Path to the CSV a stored (Parquet) table is converted from
+    """
+    return f"{RAW_DATA_DIRECTORY}/{data_file_mappings_store_sources[file_name]}"
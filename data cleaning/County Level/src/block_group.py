@@ -0,0 +1,188 @@
+import pandas as pd
+
+from src.CONSTANTS import get_file_path
+from src.helpers import NAME_COLUMNS, county_keys, decode_geoid, fips_table
+from src.profiling import add_rows_in, profiled
+from src.schema import SCHEMAS, apply_schema
+
+# Block group tables are indexed by the 12 digit GEOID (state, county, tract, block group)
+BG_KEY = "GEOID"
+
+# Rows read at once from the national block group files
+CHUNKSIZE = 200_000
+
+RACE_BG_COLUMNS = {
+    " !!Total:": "Total Population",
+    " !!Total:!!Population of one race:": "Total One Race",
+    " !!Total:!!Population of one race:!!White alone": "White Only",
+    " !!Total:!!Population of one race:!!Black or African American alone": "African American Only",
+    " !!Total:!!Population of one race:!!American Indian and Alaska Native alone": "American Indian and Alaska Native Only",
+    " !!Total:!!Population of one race:!!Asian alone": "Asain Only",
+    " !!Total:!!Population of one race:!!Native Hawaiian and Other Pacific Islander alone": "Native Hawaiian and Other Pacific Islander Only",
+    " !!Total:!!Population of one race:!!Some Other Race alone": "Others Only",
+    " !!Total:!!Population of two or more races:": "Total Mixed Raced",
+}
+
+UNEMPLOYMENT_BG_COLUMNS = {
+    "Estimate!!Total:": "Total",
+    "Estimate!!Total:!!In labor force:": "In labor force",
+    "Estimate!!Total:!!In labor force:!!Civilian labor force:": "Civilian labor force",
+    "Estimate!!Total:!!In labor force:!!Civilian labor force:!!Employed": "Employed",
+    "Estimate!!Total:!!In labor force:!!Civilian labor force:!!Unemployed": "Unemployed",
+    "Estimate!!Total:!!In labor force:!!Armed Forces": "Armed Forces",
+    "Estimate!!Total:!!Not in labor force": "Not in labor force",
+}
+
+INCOME_BG_COLUMNS = {
+    "Estimate!!Median household income in the past 12 months (in 2022 inflation-adjusted dollars)": "Median Household Income",
+}
+
+
+#### Reading #####
+def state_fips_codes(states):
+    """
+    Two digit FIPS codes of the states, given as FIPS codes or state names (None means every state)
+    """
+    if states is None:
+        return None
+    names = fips_table().drop_duplicates("State").set_index("State")["FIPS State"]
+    return {names.get(state, str(state).zfill(2)) for state in states}
+
+
+def read_acs_chunks(datapath, columns, states=None, chunksize=CHUNKSIZE):
+    """
+    Stream a data.census.gov block group table chunk by chunk
+
+    datapath: path to the table (two header rows, the second one holds the column labels)
+    columns: labels of the columns to read besides Geography
+    states: FIPS codes or names of the states to keep (every state when None)
+    chunksize: number of rows parsed at once
+
+    Yields dataframes with the columns as strings indexed by the 12 digit GEOID, only for block
+    group rows of the requested states.
+    """
+    states = state_fips_codes(states)
+    reader = pd.read_csv(
+        datapath, header=1, usecols=["Geography"] + list(columns), dtype=str, chunksize=chunksize
+    )
+    for chunk in reader:
+        add_rows_in(len(chunk))
+        # ids are <7 digit summary level>US<GEOID>, block groups are summary level 150
+        geography = chunk["Geography"]
+        keep = geography.str.startswith("150")
+        if states is not None:
+            keep &= geography.str[9:11].isin(states)
+        if not keep.any():
+            continue
+        parts = decode_geoid(geography[keep])
+        geoid = parts["FIPS State"] + parts["FIPS County"] + parts["TRACTCE"] + parts["BLKGRPCE"]
+        yield chunk.loc[keep, list(columns)].set_axis(geoid.rename(BG_KEY), axis=0)
+
+
+def to_number(df):
+    """
+    Numbers from Census estimates written as strings (e.g. "1,234", "250,000+", "-")
+    """
+    return df.apply(
+        lambda col: pd.to_numeric(col.str.replace(",", "").str.rstrip("+-"), errors="coerce")
+    )
+
+
+def set_bg_names(df):
+    """
+    Sort a GEOID indexed frame and put the state and county names of every block group first
+    """
+    df = df.sort_index()
+    keys = pd.to_numeric(df.index.str[:5], errors="coerce")
+    names = county_keys()[NAME_COLUMNS].reindex(keys).set_axis(df.index, axis=0)
+    return names.join(df.drop(columns=[c for c in NAME_COLUMNS if c in df.columns]))
+
+
+def concat_bg(frames, name):
+    """
+    Concatenate the chunks of a block group cleaner
+
+    When no row was kept (e.g. none of the requested states is in the file) the result is an empty
+    frame with the columns and dtypes of the schema instead of an error.
+    """
+    if not frames:
+        index = pd.Index([], dtype=object, name=BG_KEY)
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in SCHEMAS[name].items()}, index=index)
+    return pd.concat(frames)
+
+
+#### Block group cleaners #####
+@profiled()
+def get_race_bg(datapath, states=None, chunksize=CHUNKSIZE):
+    """
+    Total population and share of every race of the block groups (decennial P1 table)
+    """
+    frames = []
+    for chunk in read_acs_chunks(datapath, RACE_BG_COLUMNS, states, chunksize):
+        counts = to_number(chunk).rename(columns=RACE_BG_COLUMNS)
+        shares = counts.drop(columns=["Total Population"]).div(counts["Total Population"], axis=0)
+        frames.append(apply_schema(counts[["Total Population"]].join(shares.add_suffix(" Percentage")), "race_bg"))
+    return set_bg_names(concat_bg(frames, "race_bg"))
+
+
+@profiled()
+def get_unemployment_bg(datapath, states=None, chunksize=CHUNKSIZE):
+    """
+    Employment status and unemployment rate of the block groups (ACS B23025 table)
+    """
+    frames = []
+    for chunk in read_acs_chunks(datapath, UNEMPLOYMENT_BG_COLUMNS, states, chunksize):
+        data = to_number(chunk).rename(columns=UNEMPLOYMENT_BG_COLUMNS)
+        data["Unemployment Rate"] = data["Unemployed"] / data["In labor force"]
+        frames.append(apply_schema(data, "unemployment_bg"))
+    return set_bg_names(concat_bg(frames, "unemployment_bg"))
+
+
+@profiled()
+def get_income_bg(datapath, states=None, chunksize=CHUNKSIZE):
+    """
+    Median household income of the block groups (ACS B19013 table)
+    """
+    frames = [
+        apply_schema(to_number(chunk).rename(columns=INCOME_BG_COLUMNS), "income_bg")
+        for chunk in read_acs_chunks(datapath, INCOME_BG_COLUMNS, states, chunksize)
+    ]
+    return set_bg_names(concat_bg(frames, "income_bg"))
+
+
+@profiled()
+def get_solar_bg(datapath, states=None, chunksize=CHUNKSIZE):
+    """
+    Solar project size and intensities of the block groups (the cleaned solar_clean_bg table)
+    """
+    states = state_fips_codes(states)
+    frames = []
+    for chunk in pd.read_csv(datapath, dtype={BG_KEY: str, "TRACTCE": str, "BLKGRPCE": str}, chunksize=chunksize):
+        add_rows_in(len(chunk))
+        if states is not None:
+            chunk = chunk[chunk[BG_KEY].str[:2].isin(states)]
+        chunk = chunk.set_index(BG_KEY).drop(columns=["TRACTCE", "BLKGRPCE", "State", "County Name"])
+        frames.append(apply_schema(chunk, "solar_bg"))
+    return set_bg_names(concat_bg(frames, "solar_bg"))
+
+
+@profiled()
+def load_data_bg(states=None, chunksize=CHUNKSIZE):
+    """
+    Block group equivalent of main.load_data
+
+    states: FIPS codes or names of the states to build (every state when None), the other rows are
+        dropped while reading so single state builds only keep that state in memory
+    chunksize: number of rows of the national files parsed at once
+
+    Returns a dataframe indexed by the 12 digit GEOID with the state and county names, the race,
+    unemployment, income and solar columns. Every block group present in any source is kept.
+    """
+    frames = [
+        get_race_bg(get_file_path("DEC_race_bg"), states, chunksize),
+        get_unemployment_bg(get_file_path("unemployment_bg"), states, chunksize),
+        get_income_bg(get_file_path("income_bg"), states, chunksize),
+        get_solar_bg(get_file_path("solar_bg"), states, chunksize),
+    ]
+    metrics = pd.concat([frame.drop(columns=NAME_COLUMNS) for frame in frames], axis=1)
+    return set_bg_names(metrics)
@@ -0,0 +1,112 @@
+import pandas as pd
+
+from src.CONSTANTS import get_file_path
+from src.helpers import clear_reference_tables, fips_table
+from src.store import normalize_code, normalize_geoid
+
+# Polygons read at once from the national shapefiles
+CHUNKSIZE = 50_000
+
+# Equal area projection of the contiguous US the areas are computed in
+AREA_CRS = "EPSG:5070"
+MI2_PER_KM2 = 0.386102
+
+# Columns of the county and block group box tables (county_clean/county_bounding_boxes_full.csv,
+# block_group_clean/bounding_box_full_bg.csv)
+COUNTY_BOX_COLUMNS = ["GEOID", "State", "County Name", "area km2", "area mi2", "FIPS State", "FIPS County"]
+BLOCK_GROUP_BOX_COLUMNS = [
+    "GEOID", "STATEFP", "COUNTYFP", "TRACTCE", "BLKGRPCE", "State", "County Name", "area km2", "area mi2"
+]
+
+
+#### Areas #####
+def polygon_areas(geometry):
+    """
+    Area of every polygon in km2 and mi2
+
+    geometry: GeoSeries of polygons in any CRS
+
+    The polygons are reprojected once to AREA_CRS and measured with the vectorized shapely area,
+    both units come from the same array.
+    """
+    km2 = geometry.to_crs(AREA_CRS).area.to_numpy() / 10**6
+    return pd.DataFrame({"area km2": km2, "area mi2": km2 * MI2_PER_KM2}, index=geometry.index)
+
+
+#### Shapefiles #####
+def read_polygons(datapath, columns, states=None, chunksize=CHUNKSIZE):
+    """
+    Yield the polygons of a Census shapefile one chunk of rows (or one state) at a time
+
+    datapath: path to the shapefile (e.g. cb_2023_us_bg_500k.shp)
+    columns: attribute columns to read besides the geometry
+    states: two digit FIPS codes of the states to read, one after the other (every row when None)
+    chunksize: number of rows read at once when reading every row
+    """
+    import geopandas as gpd
+
+    if states is not None:
+        for state in states:
+            yield gpd.read_file(datapath, columns=columns, where=f"STATEFP = '{state}'")
+        return
+
+    import pyogrio
+
+    rows = pyogrio.read_info(datapath)["features"]
+    for start in range(0, rows, chunksize):
+        yield gpd.read_file(datapath, columns=columns, rows=slice(start, start + chunksize))
+
+
+def box_table(polygons):
+    """
+    Codes, names and areas of the polygons of a Census shapefile (without the geometry)
+
+    Only the polygons of counties in the FIPS codes table are kept.
+    """
+    df = pd.DataFrame(polygons.drop(columns=polygons.geometry.name))
+    df["GEOID"] = normalize_geoid(df["GEOID"]).astype(str)
+    df["STATEFP"] = normalize_code(df["STATEFP"], 2).astype(str)
+    df["COUNTYFP"] = normalize_code(df["COUNTYFP"], 3).astype(str)
+    df = df.join(polygon_areas(polygons.geometry))
+    return df.merge(
+        fips_table(), left_on=["STATEFP", "COUNTYFP"], right_on=["FIPS State", "FIPS County"], how="inner"
+    )
+
+
+def _build_boxes(datapath, columns, states, chunksize):
+    frames = [box_table(polygons) for polygons in read_polygons(datapath, columns, states, chunksize)]
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        raise ValueError(f"No polygon of {datapath} is in a known county")
+    return pd.concat(frames, ignore_index=True).drop_duplicates("GEOID").sort_values("GEOID", ignore_index=True)
+
+
+#### Builders #####
+def build_county_boxes(datapath, path=None, states=None, chunksize=CHUNKSIZE):
+    """
+    Build the county bounding box table read by bounding_box_getter
+
+    datapath: path to the Census county shapefile (e.g. cb_2018_us_county_500k.shp)
+    path: CSV to write (defaults to the bounding_boxes file of CONSTANTS)
+    states, chunksize: how the shapefile is read, see read_polygons
+    """
+    df = _build_boxes(datapath, ["GEOID", "STATEFP", "COUNTYFP"], states, chunksize)[COUNTY_BOX_COLUMNS]
+    df.to_csv(path or get_file_path("bounding_boxes"), index=False)
+    # the county keys are built from the bounding boxes
+    clear_reference_tables()
+    return df
+
+
+def build_block_group_boxes(datapath, path=None, states=None, chunksize=CHUNKSIZE):
+    """
+    Build the block group bounding box table
+
+    datapath: path to the Census block group shapefile (e.g. cb_2023_us_bg_500k.shp)
+    path: CSV to write (defaults to the bounding_boxes_bg file of CONSTANTS)
+    states, chunksize: how the shapefile is read, see read_polygons (only one chunk or state of
+        polygons is in memory at a time)
+    """
+    df = _build_boxes(datapath, ["GEOID", "STATEFP", "COUNTYFP", "TRACTCE", "BLKGRPCE"], states, chunksize)
+    df = df[BLOCK_GROUP_BOX_COLUMNS]
+    df.to_csv(path or get_file_path("bounding_boxes_bg"), index=False)
+    return df
@@ -0,0 +1,95 @@
+from src.CONSTANTS import get_file_path
+from src.schema import SCHEMAS
+from src.utils import *
+
+# name -> (cleaner loading the source, columns it provides)
+SOURCES = {}
+# column -> name of the source providing it (the first registered source for shared column names)
+FEATURES = {}
+# cleaned sources already computed in this process
+_FEATURE_CACHE = {}
+
+
+def register(name, loader, columns=None):
+    """
+    Register the cleaner providing a group of columns
+
+    name: name of the source
+    loader: function without arguments returning the cleaned key indexed dataframe
+    columns: the metric columns of the dataframe (defaults to the columns of its schema in SCHEMAS)
+    """
+    columns = list(SCHEMAS[name]) if columns is None else columns
+    SOURCES[name] = (loader, list(columns))
+    for column in columns:
+        FEATURES.setdefault(column, name)
+
+
+def load_source(name):
+    """
+    Cleaned dataframe of a registered source, computed once per process
+    """
+    if name not in _FEATURE_CACHE:
+        loader, columns = SOURCES[name]
+        df = loader()
+        missing = [column for column in columns if column not in df.columns]
+        if missing:
+            raise ValueError(f"Source {name} did not produce the registered columns {missing}")
+        _FEATURE_CACHE[name] = df
+    return _FEATURE_CACHE[name]
+
+
+def sources_for(columns, prefer=()):
+    """
+    Sources needed for the columns, {source name: [columns]} in the order of the columns
+
+    prefer: sources to take a column from when several provide it (e.g. ["race_acs"])
+    """
+    needed = {}
+    for column in columns:
+        name = next((name for name in prefer if column in SOURCES[name][1]), FEATURES.get(column))
+        if name is None:
+            raise ValueError(f"Unknown feature: {column}")
+        needed.setdefault(name, []).append(column)
+    return needed
+
+
+def select(columns, prefer=(), fixed_BB=None):
+    """
+    County table with only the requested columns, cleaning only the sources they come from
+
+    columns: feature columns (see FEATURES)
+    prefer: sources to take a column from when several provide it (e.g. ["race_acs"])
+    fixed_BB: optional bounding box dataframe whose columns go first (as in load_data)
+    """
+    frames = [load_source(name)[source_columns] for name, source_columns in sources_for(columns, prefer).items()]
+    merged = concat_keyed(frames, fixed_BB)
+    names = [c for c in merged.columns if c not in columns]
+    return merged[names + list(columns)]
+
+
+def clear_feature_cache():
+    _FEATURE_CACHE.clear()
+
+
+#### Registry #####
+def _dict_frame(frames):
+    return concat_keyed(list(frames.values()))
+
+
+register("wind", lambda: get_wind(get_file_path("Wind"), bounding_box_getter()))
+register(
+    "gdp", lambda: get_GDP(get_file_path("GDP"), bounding_box_getter(), get_file_path("population_data"))
+)
+register("solar", lambda: get_solar_buckets(get_file_path("Solar"), bounding_box_getter()))
+register("solar_roof", lambda: get_solar_roof_data(get_file_path("solar_roof"), bounding_box_getter()))
+register("private_schools", lambda: get_no_priv_schools(get_file_path("private_schools")))
+register("income", lambda: get_income(get_file_path("income")))
+register("unemployment", lambda: get_unemployment(get_file_path("unemployment")))
+register("race", lambda: get_race_dec(get_file_path("DEC_race")))
+register("race_acs", lambda: get_race_acs(get_file_path("ACS_race")))
+register("election", lambda: _dict_frame(get_election(get_file_path("election"), party="all")))
+register("education_18_24", lambda: get_education_18_24(get_file_path("education")))
+register("education_25_over", lambda: get_education_25_over(get_file_path("education")))
+register("electric", lambda: NREL_Electric(get_file_path("NREL_Electric")))
+register("electric_eia", lambda: _dict_frame(get_electric(get_file_path("electric"), "both")))
+register("rural_urban", lambda: get_rural_urban_coverage(get_file_path("Rural_Urban")))
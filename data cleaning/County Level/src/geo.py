@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+from src.helpers import NAME_COLUMNS, county_keys, fips_table
+from src.store import normalize_geoid
+
+BLOCK_GROUP_COLUMNS = ["GEOID", "STATEFP", "COUNTYFP", "TRACTCE", "BLKGRPCE"]
+
+# Connecticut planning regions (county code of the 2022 GEOIDs) -> code of the county they are reported under
+CT_PLANNING_REGIONS = {
+    "110": "003",  # Hartford
+    "120": "009",  # New Haven
+    "130": "013",  # Tolland
+    "140": "007",  # Middlesex
+    "150": "011",  # New London
+    "160": "015",  # Windham
+    "170": "005",  # Litchfield
+    "180": "011",  # New London
+    "190": "001",  # Fairfield
+}
+
+# States missing from the FIPS codes table, named from their state code
+STATE_NAMES = {"02": "Alaska", "15": "Hawaii"}
+
+
+#### Project points #####
+def to_points(points, crs):
+    """
+    Turn project locations into a 2D GeoSeries
+
+    points: GeoSeries / GeoDataFrame of points, or a Series of WKT strings (e.g. the WKT column of solar_raw.csv)
+    crs: CRS of the WKT strings
+    """
+    import geopandas as gpd
+    import shapely
+
+    if isinstance(points, gpd.GeoDataFrame):
+        points = points.geometry
+    elif not isinstance(points, gpd.GeoSeries):
+        points = gpd.GeoSeries.from_wkt(points, crs=crs)
+    return gpd.GeoSeries(shapely.force_2d(points.values), index=points.index, crs=points.crs)
+
+
+def assign_points_to_block_groups(points, block_groups):
+    """
+    Find the block group of every project point with a single spatial index query
+
+    points: project locations (see to_points), WKT strings are taken to be in the block group CRS
+    block_groups: GeoDataFrame of block groups with the GEOID, STATEFP, COUNTYFP, TRACTCE and BLKGRPCE columns
+
+    Returns a dataframe aligned with points with the block group columns and a 'matches' column
+    holding the number of block groups the point falls in. Points with zero or several matches
+    get empty block group columns.
+    """
+    points = to_points(points, block_groups.crs)
+    if points.crs is not None and points.crs != block_groups.crs:
+        points = points.to_crs(block_groups.crs)
+
+    point_idx, block_group_idx = block_groups.sindex.query(points.values, predicate="intersects")
+    matches = np.bincount(point_idx, minlength=len(points))
+
+    # only points inside exactly one block group get its codes
+    unique = matches[point_idx] == 1
+    values = np.full((len(points), len(BLOCK_GROUP_COLUMNS)), None, dtype=object)
+    values[point_idx[unique]] = block_groups[BLOCK_GROUP_COLUMNS].to_numpy()[block_group_idx[unique]]
+
+    assigned = pd.DataFrame(values, index=points.index, columns=BLOCK_GROUP_COLUMNS)
+    assigned["matches"] = matches
+    return assigned
+
+
+#### GEOID normalization #####
+def county_fips(geoids):
+    """
+    5 digit county code of every GEOID, Connecticut planning regions mapped to the county they are reported under
+
+    geoids: Series of zero padded GEOIDs (county, tract or block group)
+    """
+    county = geoids.str[:5]
+    remapped = "09" + county.str[2:5].map(CT_PLANNING_REGIONS)
+    return county.mask(county.str[:2].eq("09") & remapped.notna(), remapped)
+
+
+def geoid_names(geoids):
+    """
+    State and county names of every GEOID
+
+    geoids: Series of zero padded GEOIDs
+
+    Names are looked up once per distinct county code and spread back to the rows. Rows of states
+    or counties missing from the FIPS tables get NaN (Alaska and Hawaii still get their state name).
+    """
+    codes, counties = pd.factorize(county_fips(geoids))
+    counties = pd.Series(counties)
+
+    states = fips_table().drop_duplicates("FIPS State").set_index("FIPS State")["State"].to_dict()
+    states = {**states, **STATE_NAMES}
+    names = pd.DataFrame({
+        "State": counties.str[:2].map(states).astype(object),
+        "County Name": county_keys()["County Name"].reindex(pd.to_numeric(counties)).astype(object).to_numpy(),
+    })
+    # position -1 are missing GEOIDs
+    names = names.reindex(codes).set_axis(geoids.index, axis=0)
+    return names[NAME_COLUMNS]
+
+
+def normalize_block_groups(df, geoid_column="GEOID", dropna=True):
+    """
+    Rebuild the names and codes of a block group table from its GEOIDs
+
+    df: block group dataframe with a GEOID column
+    geoid_column: name of the GEOID column
+    dropna: drop the rows without a state or county name
+
+    GEOIDs are zero padded back to 12 digits, State and County Name come from geoid_names,
+    TRACTCE and BLKGRPCE from the GEOID.
+    """
+    df = df.copy()
+    geoids = normalize_geoid(df[geoid_column])
+    df[geoid_column] = geoids
+    df[NAME_COLUMNS] = geoid_names(geoids)
+    df["TRACTCE"] = geoids.str[5:11]
+    df["BLKGRPCE"] = geoids.str[11:]
+    if dropna:
+        df = df.dropna(subset=NAME_COLUMNS)
+    return df
@@ -1,38 +1,247 @@
+from functools import lru_cache
+
 import pandas as pd
 from src.CONSTANTS import get_file_path
 
 
-FIPS_DF = pd.read_csv(get_file_path('FIPS'), dtype=str)
-EIA_FIPS = pd.read_csv(get_file_path('EIA_Electric'), dtype={'utility_id_eia': str, 'county_id_fips': str})[['county_id_fips', 'utility_id_eia']]
+# Name of the canonical integer county key (5 digit FIPS code, state * 1000 + county)
+COUNTY_KEY = "FIPS"
+NAME_COLUMNS = ["State", "County Name"]
+
+# Normalized wind and GDP columns kept in the merged data
+WIND_COLUMNS = ["Wind Capacity Intensity (MW / 1000 sq mile)", "Wind Project Intensity (Projects / 1000 sq mile)", "Wind Avg Capacity Intensity (MW / 1000 sq mile)"]
+GDP_COLUMNS = ["GDP_2017", "GDP_2018", "GDP_2019", "GDP_2020", "GDP_2021", "GDP_2022"]
+
+
+
+#### Reference tables #####
+# Read on first use and cached for the process, so importing the package reads no data.
+# The old module level names (FIPS_DF, EIA_FIPS, BOUNDING_BOX_DF, NAME_DTYPES, COUNTY_KEYS) still work, see __getattr__.
+@lru_cache(maxsize=None)
+def fips_table():
+    return pd.read_csv(get_file_path('FIPS'), dtype=str)
+
+
+@lru_cache(maxsize=None)
+def eia_fips_table():
+    return pd.read_csv(get_file_path('EIA_Electric'), dtype={'utility_id_eia': str, 'county_id_fips': str})[['county_id_fips', 'utility_id_eia']]
+
+
+@lru_cache(maxsize=None)
+def bounding_box_table():
+    return pd.read_csv(get_file_path("bounding_boxes"), dtype={"FIPS State": str, "FIPS County": str})
+
+
+def county_key(state_fips, county_fips=None):
+    """
+    Build the integer county key from the state and county FIPS codes
+
+    state_fips: state FIPS codes (strings or numbers), or the full 5 digit codes if county_fips is None
+    county_fips: county FIPS codes (strings or numbers)
+
+    Returns a float series (NaN where a code is missing), use set_county_key to index a frame by it
+    """
+    if county_fips is None:
+        return pd.to_numeric(state_fips, errors="coerce")
+    return pd.to_numeric(state_fips, errors="coerce") * 1000 + pd.to_numeric(county_fips, errors="coerce")
+
+
+# Census geography ids end in the GEOID: 2 digit state, 3 digit county, 6 digit tract, 1 digit block group
+GEOID_PATTERN = r"(?:^|US)(\d{2})(\d{3})?(\d{6})?(\d)?$"
+GEOID_PARTS = ["FIPS State", "FIPS County", "TRACTCE", "BLKGRPCE"]
+
+
+def decode_geoid(geography):
+    """
+    Split Census geography ids into their FIPS parts in one vectorized pass
+
+    geography: series of Census "Geography" ids (e.g. 0500000US01001, 1500000US010010201001)
+        or bare GEOIDs (e.g. 01001, 010010201001)
+
+    Returns a dataframe with the FIPS State, FIPS County, TRACTCE and BLKGRPCE strings
+    (NaN for the parts a row does not have, e.g. the tract of a county id).
+    """
+    parts = geography.astype("str").str.extract(GEOID_PATTERN)
+    parts.columns = GEOID_PARTS
+    return parts
+
+
+def build_county_keys(fips, bounding_boxes):
+    """
+    Table of every known county indexed by the county key with its names and area
+
+    fips: the FIPS codes dataframe
+    bounding_boxes: the fixed bounding box dataframe
+    """
+    keys = fips.set_index(
+        county_key(fips["FIPS State"], fips["FIPS County"]).astype("int32").rename(COUNTY_KEY)
+    )[NAME_COLUMNS]
+    areas = bounding_boxes.set_index(
+        county_key(bounding_boxes["FIPS State"], bounding_boxes["FIPS County"]).astype("int32").rename(COUNTY_KEY)
+    )[["area km2", "area mi2"]]
+    return keys.join(areas, how="outer").sort_index()
+
+
+@lru_cache(maxsize=None)
+def name_dtypes():
+    """
+    State and county names are categoricals sharing the same categories in every cleaned frame
+    """
+    fips, bounding_boxes = fips_table(), bounding_box_table()
+    return {
+        col: pd.CategoricalDtype(sorted(set(fips[col].dropna()) | set(bounding_boxes[col].dropna())))
+        for col in NAME_COLUMNS
+    }
+
+
+@lru_cache(maxsize=None)
+def county_keys():
+    return build_county_keys(fips_table(), bounding_box_table()).astype(name_dtypes())
+
+
+@lru_cache(maxsize=None)
+def utility_counties():
+    """
+    Integer keyed utility to county table from the EIA service territories
+
+    Returns a dataframe with the utility_id_eia (int64) and the county key (int32) of every distinct
+    utility / known county pair, and the weight of the county in the utility (1 / number of counties
+    the utility serves).
+    """
+    table = pd.DataFrame({
+        "utility_id_eia": pd.to_numeric(eia_fips_table()["utility_id_eia"], errors="coerce"),
+        COUNTY_KEY: county_key(eia_fips_table()["county_id_fips"]),
+    }).dropna()
+    # territories are listed once per report year
+    table = table[table[COUNTY_KEY].isin(county_keys().index)].drop_duplicates()
+    table = table.astype({"utility_id_eia": "int64", COUNTY_KEY: "int32"}).reset_index(drop=True)
+    table["weight"] = 1 / table.groupby("utility_id_eia")[COUNTY_KEY].transform("size")
+    return table
+
+
+_LAZY_TABLES = {
+    "FIPS_DF": fips_table,
+    "EIA_FIPS": eia_fips_table,
+    "BOUNDING_BOX_DF": bounding_box_table,
+    "NAME_DTYPES": name_dtypes,
+    "COUNTY_KEYS": county_keys,
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_TABLES:
+        return _LAZY_TABLES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def clear_reference_tables():
+    """
+    Forget the reference tables read so far (e.g. after pointing RAW_DATA_DIRECTORY somewhere else)
+    """
+    for getter in list(_LAZY_TABLES.values()) + [utility_counties]:
+        getter.cache_clear()
+
+
+def set_county_key(df, key):
+    """
+    Index a cleaned frame by the county key and put the state and county names in front
+
+    df: the cleaned dataframe
+    key: county key of every row (see county_key)
+
+    Rows without a key or with a key that is not a known county are dropped.
+    """
+    key = pd.Series(key, index=df.index)
+    keys = county_keys()
+    known = key.isin(keys.index)
+    df = df.loc[known].drop(columns=[c for c in NAME_COLUMNS if c in df.columns])
+    df.index = pd.Index(key[known].astype("int32"), name=COUNTY_KEY)
+    return keys[NAME_COLUMNS].join(df, how="inner")
+
+
+def _normalize_county_name(names):
+    return (
+        names.str.replace(r" (County|Parish)$", "", regex=True)
+        .str.replace(".", "", regex=False)
+        .str.strip()
+        .str.casefold()
+    )
+
+
+def key_from_names(df, fixed_BB=None, state_col="State", county_col="County Name"):
+    """
+    Look up the county key of every row from its state and county names
+
+    df: dataframe with the state and county names
+    fixed_BB: the fixed bounding box dataframe to look the names up in (defaults to every known county)
+    state_col, county_col: the columns holding the state and county names
+
+    Names are compared without a trailing " County"/" Parish", without "." and ignoring case.
+    """
+    if fixed_BB is None:
+        lookup = county_keys()[NAME_COLUMNS].reset_index()
+    else:
+        lookup = fixed_BB[NAME_COLUMNS].copy()
+        lookup[COUNTY_KEY] = county_key(fixed_BB["FIPS State"], fixed_BB["FIPS County"])
+    lookup = lookup.set_index([lookup["State"].str.casefold(), _normalize_county_name(lookup["County Name"])])[COUNTY_KEY]
+    lookup = lookup[~lookup.index.duplicated()]
+
+    names = pd.MultiIndex.from_arrays([df[state_col].str.casefold(), _normalize_county_name(df[county_col])])
+    return pd.Series(lookup.reindex(names).to_numpy(), index=df.index)
+
+
+def area_by_key(fixed_BB):
+    """
+    Area in square miles of every county in the bounding box dataframe indexed by the county key
+    """
+    return fixed_BB.set_index(
+        county_key(fixed_BB["FIPS State"], fixed_BB["FIPS County"]).astype("int32").rename(COUNTY_KEY)
+    )["area mi2"]
+
+
+def concat_keyed(frames, fixed_BB=None):
+    """
+    Assemble key indexed frames side by side in a single index aligned concat
+
+    frames: list of dataframes indexed by the county key
+    fixed_BB: optional bounding box dataframe whose columns go first
+
+    Every county present in any frame (or in the bounding box) is kept, like chained outer merges would.
+    """
+    metrics = pd.concat([f.drop(columns=[c for c in NAME_COLUMNS if c in f.columns]) for f in frames], axis=1)
+    if fixed_BB is None:
+        return county_keys()[NAME_COLUMNS].join(metrics, how="right").sort_index()
+
+    base = fixed_BB.set_index(
+        county_key(fixed_BB["FIPS State"], fixed_BB["FIPS County"]).astype("int32").rename(COUNTY_KEY)
+    ).astype({**name_dtypes(), "FIPS State": "category", "FIPS County": "category"})
+    merged = base.join(metrics, how="outer")
+    # counties outside the bounding box still get their names
+    merged[NAME_COLUMNS] = merged[NAME_COLUMNS].fillna(county_keys()[NAME_COLUMNS].reindex(merged.index))
+    merged.index.name = COUNTY_KEY
+    return merged.sort_index()
+
 
 def to_int(df):
     # strip all ',' from string numbers
-    df = df.apply(lambda x: x.replace(",", "") if type(x) == str else x)
-    return df.astype(float)
+    return df.replace(",", "", regex=True).astype(float)
 
 def merged_normalized_data(wind, gdp, solar, BB):
-    important_cols = ["State", "County Name", "Wind Capacity Intensity (MW / 1000 sq mile)", "Wind Project Intensity (Projects / 1000 sq mile)", "Wind Avg Capacity Intensity (MW / 1000 sq mile)", "GDP_2017", "GDP_2018", "GDP_2019", "GDP_2020", "GDP_2021", "GDP_2022"]
-
-    merged = wind.merge(gdp, on=["State", "County Name"], how='outer')
-
-    merged = merged[important_cols]
-    
-    merged = BB.merge(merged, on=["State", "County Name"], how='outer')
-    
     if type(solar) == dict:
-        for key in solar.keys():
-            merged = merged.merge(solar[key], on=["State", "County Name"], how='outer')
+        solar = list(solar.values())
     else:
-        merged = merged.merge(solar, on=["State", "County Name"], how='outer')
-        
+        solar = [solar]
 
-    return merged
+    return concat_keyed([wind[WIND_COLUMNS], gdp[GDP_COLUMNS]] + solar, BB)
 
 def FIPS_getter():
-    return FIPS_DF
+    return fips_table()
     
 def EIA_FIPS_getter():
-    return EIA_FIPS
+    return eia_fips_table()
+
+def bounding_box_getter():
+    return bounding_box_table()
 
 def get_state_abbr():
     return {
@@ -1,35 +1,37 @@
 import pandas as pd
 from src.utils import *
-from src.CONSTANTS import get_file_path
+from src.CONSTANTS import SOLAR_SIZE_EDGES, get_file_path
+from src.profiling import profiled
 
-bounding_box = pd.read_csv(get_file_path("bounding_boxes"), dtype={"FIPS State": str, "FIPS County": str})
 
+def __getattr__(name):
+    # the bounding boxes are read on first use instead of at import
+    if name == 'bounding_box':
+        return bounding_box_getter()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@profiled()
 def load_data(
-    race_type = 'DEC', election_type = 'Democrat', education_type = '18-24', solar_type = 'all', electric_customer_class= 'both', electric_dataset='NREL'
+    race_type = 'DEC', election_type = 'Democrat', education_type = '18-24', solar_type = 'all', electric_customer_class= 'both', electric_dataset='NREL', solar_size_edges=SOLAR_SIZE_EDGES
 ):
+    bounding_box = bounding_box_getter()
+
     # Normalized data
     wind = get_wind(get_file_path('Wind'), bounding_box) 
     gdp = get_GDP(get_file_path('GDP'), bounding_box, get_file_path('population_data'))
 
     if solar_type == 'all':
-        solar_all= get_solar(get_file_path('Solar'), bounding_box, size='all')
-        solar_small = get_solar(get_file_path('Solar'), bounding_box, size='small')
-        solar_medium = get_solar(get_file_path('Solar'), bounding_box, size='medium')
-        solar_large = get_solar(get_file_path('Solar'), bounding_box, size='large')
-        solar = {
-            'all': solar_all,
-            'small': solar_small,
-            'medium': solar_medium,
-            'large': solar_large
-        }
+        # every size bucket in a single wide frame
+        solar = get_solar_buckets(get_file_path('Solar'), bounding_box, edges=solar_size_edges)
     elif solar_type == 'small_only':
-        solar = get_solar(get_file_path('Solar'), bounding_box, size='small')
+        solar = get_solar(get_file_path('Solar'), bounding_box, size='small', edges=solar_size_edges)
     elif solar_type == 'medium_only':
-        solar = get_solar(get_file_path('Solar'), bounding_box, size='medium')
+        solar = get_solar(get_file_path('Solar'), bounding_box, size='medium', edges=solar_size_edges)
     elif solar_type == 'large_only':
-        solar = get_solar(get_file_path('Solar'), bounding_box, size='large')
+        solar = get_solar(get_file_path('Solar'), bounding_box, size='large', edges=solar_size_edges)
     elif solar_type == 'all_only':
-        solar = get_solar(get_file_path('Solar'), bounding_box, size='all')
+        solar = get_solar(get_file_path('Solar'), bounding_box, size='all', edges=solar_size_edges)
     else:
         raise ValueError(f"Invalid solar type: {solar_type}")
     
@@ -82,50 +84,131 @@ def load_data(
     else:
         raise ValueError(f"Invalid education type: {education_type}")
     
-    # Merge all normalized data
-    merged = merged_normalized_data(wind, gdp, solar, bounding_box)
-    
-    # Merge Private Schools
-    merged = merged.merge(private_schools, on=["State", "County Name"], how='outer')
-    
-    # Merge Income
-    merged = merged.merge(income, on=["State", "County Name"], how='outer')
-    
-    # Merged Unemployment
-    merged = merged.merge(unemployment, on=["State", "County Name"], how='outer')
-    
-    # Merge Race
-    merged = merged.merge(race, on=["State", "County Name"], how='outer')
-    
-    # Merge Solar Roof
-    merged = merged.merge(solar_roof, on=["State", "County Name"], how='outer')
-    
-    # Merge Election
-    if type(election) == dict:
-        for key in election.keys():
-            merged = merged.merge(election[key], on=["State", "County Name"], how='outer')
-    else:
-        merged = merged.merge(election, on=["State", "County Name"], how='outer')
-        
-    # Merge Education
+    # Assemble every source side by side on the county key
+    frames = [wind[WIND_COLUMNS], gdp[GDP_COLUMNS]]
+    frames += list(solar.values()) if type(solar) == dict else [solar]
+    frames += [private_schools, income, unemployment, race, solar_roof]
+    frames += list(election.values()) if type(election) == dict else [election]
     if education_type == "all":
-        merged = merged.merge(education_18_24, on=["State", "County Name"], how='outer')
-        merged = merged.merge(education_25_over, on=["State", "County Name"], how='outer')
+        frames += [education_18_24, education_25_over]
     else:
-        merged = merged.merge(education, on=["State", "County Name"], how='outer')
-        
-    # Merge Electric
-    if electric_dataset == 'NREL':
-        merged = merged.merge(electric, on=["State", "County Name"], how='outer')
-    elif electric_dataset == 'EIA':
-        if electric_customer_class == 'both':
-            for k in electric.keys():
-                merged = merged.merge(electric[k], on=["State", "County Name"], how='outer')
-        else:
-            merged = merged.merge(electric, on=["State", "County Name"], how='outer')
+        frames.append(education)
+    if electric_dataset == 'EIA' and electric_customer_class == 'both':
+        frames += list(electric.values())
+    else:
+        frames.append(electric)
+
+    merged = concat_keyed(frames, bounding_box)
     
     return merged
     
     
     
     
+#### Option matrix #####
+# Variants of the election frame for every election_type, in the order of get_election(party='all')
+ELECTION_VARIANTS = {
+    'Democrat': ['democrat'], 'Republican': ['republican'], 'Green': ['green'],
+    'Libertarian': ['libertarian'], 'Other': ['other'],
+    'all': ['democrat', 'republican', 'green', 'libertarian', 'other'],
+}
+
+
+@profiled()
+def materialize_load_data(solar_size_edges=SOLAR_SIZE_EDGES, electric_datasets=('NREL', 'EIA')):
+    """
+    Clean every source once for all the load_data options
+
+    solar_size_edges: same as in load_data
+    electric_datasets: electric datasets to include (the options using the others cannot be selected)
+
+    Returns a wide table indexed by the county key with (source, variant, column) columns holding
+    every frame any option combination of load_data can use, see select_load_data.
+    Each source file is cleaned once, every variant of a source comes from the same cleaning.
+    """
+    bounding_box = bounding_box_getter()
+    variants = {}
+    variants[('wind', '')] = get_wind(get_file_path('Wind'), bounding_box)[WIND_COLUMNS]
+    variants[('gdp', '')] = get_GDP(get_file_path('GDP'), bounding_box, get_file_path('population_data'))[GDP_COLUMNS]
+
+    solar = get_solar_buckets(get_file_path('Solar'), bounding_box, edges=solar_size_edges)
+    variants[('solar', 'all')] = solar
+    for size in ['all'] + list(SOLAR_SIZE_LABELS):
+        variants[('solar', f'{size}_only')] = solar_size(solar, size)
+
+    variants[('private_schools', '')] = get_no_priv_schools(get_file_path('private_schools'))
+    variants[('income', '')] = get_income(get_file_path('income'))
+    variants[('unemployment', '')] = get_unemployment(get_file_path('unemployment'))
+    variants[('race', 'DEC')] = get_race_dec(get_file_path("DEC_race"))
+    variants[('race', 'ACS')] = get_race_acs(get_file_path("ACS_race"))
+    variants[('solar_roof', '')] = get_solar_roof_data(get_file_path('solar_roof'), bounding_box)
+
+    for party, frame in get_election(get_file_path("election"), party='all').items():
+        variants[('election', party)] = frame
+
+    variants[('education', '18-24')] = get_education_18_24(get_file_path("education"))
+    variants[('education', '25+')] = get_education_25_over(get_file_path("education"))
+
+    if 'NREL' in electric_datasets:
+        variants[('electric', 'NREL')] = NREL_Electric(get_file_path('NREL_Electric'))
+    if 'EIA' in electric_datasets:
+        for customer_class, frame in get_electric(get_file_path('electric'), 'both').items():
+            variants[('electric', customer_class)] = frame
+
+    # remember which counties every variant has, its column order and dtypes (the outer concat fills the others with NaN)
+    wide = pd.concat(
+        {key: frame.assign(_present=True) for key, frame in variants.items()}, axis=1
+    ).sort_index(axis=1)
+    wide.attrs['dtypes'] = {key: frame.dtypes.to_dict() for key, frame in variants.items()}
+    return wide
+
+
+def option_variants(
+    race_type = 'DEC', election_type = 'Democrat', education_type = '18-24', solar_type = 'all', electric_customer_class= 'both', electric_dataset='NREL'
+):
+    """
+    (source, variant) of the frames load_data assembles for the given options, in its column order
+    """
+    if solar_type not in ['all', 'small_only', 'medium_only', 'large_only', 'all_only']:
+        raise ValueError(f"Invalid solar type: {solar_type}")
+    if race_type not in ['DEC', 'ACS']:
+        raise ValueError(f"Invalid data type: {race_type}")
+    if election_type not in ELECTION_VARIANTS:
+        raise ValueError(f"Invalid party type: {election_type}")
+    if education_type not in ['18-24', '25+', 'all']:
+        raise ValueError(f"Invalid education type: {education_type}")
+
+    keys = [('wind', ''), ('gdp', ''), ('solar', solar_type)]
+    keys += [('private_schools', ''), ('income', ''), ('unemployment', ''), ('race', race_type), ('solar_roof', '')]
+    keys += [('election', party) for party in ELECTION_VARIANTS[election_type]]
+    keys += [('education', '18-24'), ('education', '25+')] if education_type == 'all' else [('education', education_type)]
+    if electric_dataset == 'NREL':
+        keys.append(('electric', 'NREL'))
+    elif electric_customer_class == 'both':
+        keys += [('electric', 'commercial'), ('electric', 'residential')]
+    else:
+        keys.append(('electric', electric_customer_class))
+    return keys
+
+
+def select_load_data(wide, **options):
+    """
+    The load_data table for the given options, projected from the materialize_load_data table
+
+    wide: the materialize_load_data output
+    options: the load_data options (except solar_size_edges, fixed at materialization)
+    """
+    variant_dtypes = wide.attrs['dtypes']
+    # pandas copies attrs into every intermediate frame, the projection does not need them
+    wide = wide.copy(deep=False)
+    wide.attrs = {}
+
+    frames = []
+    for key in option_variants(**options):
+        if key not in variant_dtypes:
+            raise ValueError(f"Invalid option: {key[0]} {key[1]}")
+        dtypes = variant_dtypes[key]
+        frame = wide[key]
+        frame = frame.loc[frame['_present'].notna(), list(dtypes)]
+        frames.append(frame.astype(dtypes))
+    return concat_keyed(frames, bounding_box_getter())
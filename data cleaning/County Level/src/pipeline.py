@@ -0,0 +1,313 @@
+import hashlib
+import json
+import os
+import pickle
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from src import CONSTANTS
+from src.CONSTANTS import SOLAR_SIZE_EDGES, get_file_path
+from src.profiling import count_rows, stage as profile_stage
+from src.schema import validate
+from src.utils import *
+
+# Folder of the raw data directory holding the stage outputs and the manifest of their fingerprints
+PIPELINE_FOLDER = "pipeline"
+
+# Inputs every stage depends on (the county keys are built from them)
+SHARED_INPUTS = ["FIPS", "bounding_boxes"]
+
+# Source files of the cleaning code, a change in them rebuilds every stage
+CODE_FILES = [
+    os.path.join(os.path.dirname(__file__), name)
+    for name in ["helpers.py", "utils.py", "sources.py", "schema.py", "pipeline.py"]
+]
+
+# name: stage name, build: function(paths, deps, **options) returning the stage output,
+# inputs: file names from CONSTANTS (get_file_path), upstream: names of the stages it uses, options: build keyword arguments,
+# schema: schema names (src/schema.py) the output frames are validated against
+Stage = namedtuple("Stage", ["name", "build", "inputs", "upstream", "options", "schema"], defaults=[(), (), {}, None])
+
+
+#### Stage builders #####
+def _bounding_box(paths, deps):
+    return bounding_box_getter()
+
+
+def _wind(paths, deps):
+    return get_wind(paths["Wind"], deps["bounding_box"])[WIND_COLUMNS]
+
+
+def _gdp(paths, deps):
+    return get_GDP(paths["GDP"], deps["bounding_box"], paths["population_data"])[GDP_COLUMNS]
+
+
+def _solar(paths, deps, solar_type, edges):
+    if solar_type == "all":
+        return get_solar_buckets(paths["Solar"], deps["bounding_box"], edges=edges)
+    return get_solar(paths["Solar"], deps["bounding_box"], size=solar_type.replace("_only", ""), edges=edges)
+
+
+def _solar_roof(paths, deps):
+    return get_solar_roof_data(paths["solar_roof"], deps["bounding_box"])
+
+
+def _private_schools(paths, deps):
+    return get_no_priv_schools(paths["private_schools"])
+
+
+def _income(paths, deps):
+    return get_income(paths["income"])
+
+
+def _unemployment(paths, deps):
+    return get_unemployment(paths["unemployment"])
+
+
+def _race(paths, deps, race_type):
+    if race_type == "DEC":
+        return get_race_dec(paths["DEC_race"])
+    return get_race_acs(paths["ACS_race"])
+
+
+def _election(paths, deps, party):
+    return get_election(paths["election"], party=party)
+
+
+def _education(paths, deps, education_type):
+    if education_type == "18-24":
+        return get_education_18_24(paths["education"])
+    if education_type == "25+":
+        return get_education_25_over(paths["education"])
+    return [get_education_18_24(paths["education"]), get_education_25_over(paths["education"])]
+
+
+def _electric(paths, deps, electric_dataset, customer_class):
+    if electric_dataset == "NREL":
+        return NREL_Electric(paths["NREL_Electric"])
+    return get_electric(paths["electric"], customer_class)
+
+
+def _frames(output):
+    """
+    The metric frames of a stage output (a frame, a list or a dict of frames)
+    """
+    if isinstance(output, dict):
+        return list(output.values())
+    if isinstance(output, list):
+        return output
+    return [output]
+
+
+def _merge(paths, deps, order):
+    frames = []
+    for name in order:
+        frames += _frames(deps[name])
+    return concat_keyed(frames, deps["bounding_box"])
+
+
+def county_stages(
+    race_type='DEC', election_type='Democrat', education_type='18-24', solar_type='all',
+    electric_customer_class='both', electric_dataset='NREL', solar_size_edges=SOLAR_SIZE_EDGES
+):
+    """
+    Stages of the county data pipeline, producing the same merged table as main.load_data with the same options
+    """
+    if race_type not in ["DEC", "ACS"]:
+        raise ValueError(f"Invalid data type: {race_type}")
+    if election_type not in ["Democrat", "Republican", "Other", "Green", "Libertarian", "all"]:
+        raise ValueError(f"Invalid party type: {election_type}")
+    if education_type not in ["18-24", "25+", "all"]:
+        raise ValueError(f"Invalid education type: {education_type}")
+    if solar_type not in ["all", "small_only", "medium_only", "large_only", "all_only"]:
+        raise ValueError(f"Invalid solar type: {solar_type}")
+
+    stages = [
+        Stage("bounding_box", _bounding_box),
+        Stage("wind", _wind, ["Wind"], ["bounding_box"], schema=["wind"]),
+        Stage("gdp", _gdp, ["GDP", "population_data"], ["bounding_box"], schema=["gdp"]),
+        Stage(
+            "solar", _solar, ["Solar"], ["bounding_box"], {"solar_type": solar_type, "edges": tuple(solar_size_edges)},
+            schema=["solar"]
+        ),
+        Stage("private_schools", _private_schools, ["private_schools"], schema=["private_schools"]),
+        Stage("income", _income, ["income"], schema=["income"]),
+        Stage("unemployment", _unemployment, ["unemployment"], schema=["unemployment"]),
+        Stage(
+            "race", _race, ["DEC_race" if race_type == "DEC" else "ACS_race"], options={"race_type": race_type},
+            schema=["race" if race_type == "DEC" else "race_acs"]
+        ),
+        Stage("solar_roof", _solar_roof, ["solar_roof"], ["bounding_box"], schema=["solar_roof"]),
+        Stage("election", _election, ["election"], options={"party": election_type}, schema=["election"]),
+        Stage(
+            "education", _education, ["education"], options={"education_type": education_type},
+            schema=["education_18_24", "education_25_over"]
+        ),
+        Stage(
+            "electric", _electric, ["NREL_Electric" if electric_dataset == "NREL" else "electric"],
+            options={"electric_dataset": electric_dataset, "customer_class": electric_customer_class},
+            schema=["electric" if electric_dataset == "NREL" else "electric_eia"]
+        ),
+    ]
+    # the merged columns come in the order of load_data
+    order = [stage.name for stage in stages[1:]]
+    stages.append(Stage("merged", _merge, upstream=["bounding_box"] + order, options={"order": order}))
+    return stages
+
+
+#### Fingerprints #####
+def file_hash(path, known=None):
+    """
+    SHA-1 of the content of a file (and of its sidecar files for shapefiles)
+
+    known: {path: [size, mtime, hash]} of files hashed before, reused when the size and mtime match
+    """
+    paths = [path]
+    if path.endswith(".shp"):
+        stem = path[:-len(".shp")]
+        folder = os.path.dirname(path) or "."
+        paths = sorted(
+            os.path.join(folder, name) for name in os.listdir(folder)
+            if os.path.join(folder, name).startswith(stem + ".")
+        )
+
+    digest = hashlib.sha1()
+    for part in paths:
+        stat = os.stat(part)
+        entry = (known or {}).get(part)
+        if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime]:
+            part_hash = entry[2]
+        else:
+            part_digest = hashlib.sha1()
+            with open(part, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    part_digest.update(block)
+            part_hash = part_digest.hexdigest()
+            if known is not None:
+                known[part] = [stat.st_size, stat.st_mtime, part_hash]
+        digest.update(f"{os.path.basename(part)}:{part_hash}".encode())
+    return digest.hexdigest()
+
+
+def stage_fingerprint(stage, input_hashes, upstream_fingerprints, code_hash):
+    """
+    Hash of everything a stage output depends on: its inputs, its options, its upstream stages and the code
+    """
+    digest = hashlib.sha1()
+    digest.update(repr((stage.name, stage.build.__name__, sorted(stage.options.items()))).encode())
+    for name in stage.inputs:
+        digest.update(f"{name}:{input_hashes[name]}".encode())
+    for name in stage.upstream:
+        digest.update(f"{name}:{upstream_fingerprints[name]}".encode())
+    digest.update(code_hash.encode())
+    return digest.hexdigest()
+
+
+#### Runner #####
+def _load_manifest(directory):
+    path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(path):
+        return {"stages": {}, "files": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_manifest(directory, manifest):
+    path = os.path.join(directory, "manifest.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+
+def run_pipeline(stages=None, directory=None, workers=4, force=False, verbose=True):
+    """
+    Run the stages whose inputs changed since the last run, independent stages at the same time
+
+    stages: list of Stage (defaults to county_stages())
+    directory: folder holding the stage outputs and the manifest (defaults to the pipeline folder of the
+        raw data directory, read at call time like get_file_path)
+    workers: number of stages run at the same time
+    force: rebuild every stage
+
+    A stage is rebuilt when the content of one of its input files, its options, the cleaning code
+    or one of its upstream stages changed; otherwise its saved output is reused.
+    Returns {stage name: output}.
+    """
+    stages = county_stages() if stages is None else stages
+    directory = f"{CONSTANTS.RAW_DATA_DIRECTORY}/{PIPELINE_FOLDER}" if directory is None else directory
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [name for name in stage.upstream if name not in by_name]
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages {missing}")
+
+    os.makedirs(directory, exist_ok=True)
+    manifest = _load_manifest(directory)
+
+    # every input file is hashed once, files that did not change are not read again
+    input_names = {name for stage in stages for name in list(stage.inputs) + SHARED_INPUTS}
+    input_hashes = {name: file_hash(get_file_path(name), manifest["files"]) for name in sorted(input_names)}
+    code_hash = hashlib.sha1("".join(
+        [file_hash(path, manifest["files"]) for path in CODE_FILES]
+        + [input_hashes[name] for name in SHARED_INPUTS]
+    ).encode()).hexdigest()
+
+    fingerprints = {}
+    outputs = {}
+    pending = list(stages)
+    running = {}
+
+    def output_path(name):
+        return os.path.join(directory, f"{name}.pkl")
+
+    def build(stage):
+        paths = {name: get_file_path(name) for name in stage.inputs}
+        deps = {name: outputs[name] for name in stage.upstream}
+        with profile_stage(f"pipeline.{stage.name}") as record:
+            output = stage.build(paths, deps, **stage.options)
+            record["rows_out"] = count_rows(output)
+        if stage.schema is not None:
+            for frame in _frames(output):
+                validate(frame, stage.schema)
+        with open(f"{output_path(stage.name)}.tmp", "wb") as f:
+            pickle.dump(output, f)
+        os.replace(f"{output_path(stage.name)}.tmp", output_path(stage.name))
+        return output
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            # start every stage whose upstream stages are done (reused outputs may unlock more stages)
+            ready = [stage for stage in pending if all(name in outputs for name in stage.upstream)]
+            while ready:
+                stage = ready.pop(0)
+                pending.remove(stage)
+                fingerprint = stage_fingerprint(stage, input_hashes, fingerprints, code_hash)
+                fingerprints[stage.name] = fingerprint
+                if not force and manifest["stages"].get(stage.name) == fingerprint and os.path.exists(output_path(stage.name)):
+                    with open(output_path(stage.name), "rb") as f:
+                        outputs[stage.name] = pickle.load(f)
+                    if verbose:
+                        print(f"{stage.name}: up to date")
+                    ready += [
+                        other for other in pending
+                        if other not in ready and all(name in outputs for name in other.upstream)
+                    ]
+                    continue
+                if verbose:
+                    print(f"{stage.name}: running")
+                running[pool.submit(build, stage)] = stage
+
+            if not running:
+                if pending:
+                    raise ValueError(f"Circular dependency between stages {[stage.name for stage in pending]}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                outputs[stage.name] = future.result()
+                manifest["stages"][stage.name] = fingerprints[stage.name]
+                _save_manifest(directory, manifest)
+
+    _save_manifest(directory, manifest)
+    return outputs
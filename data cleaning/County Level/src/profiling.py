@@ -0,0 +1,241 @@
+"""
+Stage level instrumentation of the cleaning code
+
+Cleaners, load_data and the zonal statistics are wrapped with @profiled (or a `with stage(...)` block).
+Nothing is measured until tracing is turned on with enable_trace (or the CLEANING_TRACE environment
+variable holding the trace file path); after that every stage appends one JSON line to the trace file:
+
+    {"stage": "get_solar", "parent": "load_data", "depth": 1, "wall_s": 0.05, "rows_in": 4120, "rows_out": 3143,
+     "rss_start": ..., "rss_end": ..., "peak_rss": ..., "peak_rss_increase": ..., "bytes_read": ..., "error": null}
+
+rows_in counts the rows of the raw tables read through src.sources (or given by the stage), rows_out
+the rows of the returned frames. peak_rss is the high-water mark of the process when the stage ends,
+peak_rss_increase how much the stage raised it. bytes_read is what the process read during the stage
+(Linux only). Memory and bytes are process wide, so stages running at the same time on several threads
+share them.
+
+This module only depends on the standard library so the raster scripts can use it as well.
+"""
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger("cleaning.profiling")
+
+# environment variable holding the path of the trace file, turns tracing on at import
+TRACE_ENV = "CLEANING_TRACE"
+
+_TRACE = {"enabled": False, "path": None, "progress": False, "records": []}
+_TRACE_LOCK = threading.Lock()
+# stack of the stages open in the current thread
+_LOCAL = threading.local()
+
+
+#### Tracing #####
+def enable_trace(path=None, progress=False):
+    """
+    Start recording the stages
+
+    path: JSON lines file the records are appended to (records are only kept in memory when None)
+    progress: show a progress bar (tqdm, when installed) over the raster layers
+    """
+    with _TRACE_LOCK:
+        _TRACE.update(enabled=True, path=path, progress=progress, records=[])
+
+
+def disable_trace():
+    with _TRACE_LOCK:
+        _TRACE.update(enabled=False, path=None, progress=False)
+
+
+def trace_records():
+    """
+    Records of the stages finished since enable_trace
+    """
+    with _TRACE_LOCK:
+        return list(_TRACE["records"])
+
+
+def read_trace(path):
+    """
+    Records of a trace file as a dataframe, one row per stage run
+    """
+    import pandas as pd
+
+    return pd.read_json(path, lines=True)
+
+
+def summarize_trace(records):
+    """
+    Total wall time, runs, rows and memory per stage, slowest stages first
+
+    records: dataframe from read_trace or the list from trace_records
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(records)
+    return (
+        df.groupby("stage")
+        .agg(
+            runs=("wall_s", "size"), wall_s=("wall_s", "sum"), rows_in=("rows_in", "sum"),
+            rows_out=("rows_out", "sum"), peak_rss=("peak_rss", "max"), bytes_read=("bytes_read", "sum"),
+        )
+        .sort_values("wall_s", ascending=False)
+    )
+
+
+def _write(record):
+    with _TRACE_LOCK:
+        _TRACE["records"].append(record)
+        if _TRACE["path"] is not None:
+            with open(_TRACE["path"], "a") as f:
+                f.write(json.dumps(record) + "\n")
+    logger.debug("%s", record)
+
+
+#### Measurements #####
+def _rss():
+    # resident memory in bytes (Linux), None elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _bytes_read():
+    # bytes read by the process through read calls (Linux), None elsewhere
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def count_rows(output):
+    """
+    Number of rows of a stage output (a frame, or a dict / list / tuple of frames), None for anything else
+    """
+    if isinstance(output, dict):
+        output = list(output.values())
+    if isinstance(output, (list, tuple)):
+        counts = [count_rows(item) for item in output]
+        return None if any(count is None for count in counts) else sum(counts)
+    return len(output) if hasattr(output, "shape") else None
+
+
+def _delta(end, start):
+    return None if end is None or start is None else end - start
+
+
+def _stack():
+    if not hasattr(_LOCAL, "stack"):
+        _LOCAL.stack = []
+    return _LOCAL.stack
+
+
+def add_rows_in(rows):
+    """
+    Count rows read from a raw table towards every stage open in this thread
+    """
+    for record in _stack():
+        record["rows_in"] = (record["rows_in"] or 0) + rows
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Record the wall time, rows and memory of the enclosed block as the stage name
+
+    rows_in: number of input rows when the stage does not read them through src.sources
+    Yields the record, set record["rows_out"] to report the rows produced.
+    """
+    if not _TRACE["enabled"]:
+        yield {}
+        return
+
+    stack = _stack()
+    record = {
+        "stage": name, "parent": stack[-1]["stage"] if stack else None, "depth": len(stack),
+        "thread": threading.current_thread().name, "start": time.time(), "wall_s": None,
+        "rows_in": rows_in, "rows_out": None, "rss_start": _rss(), "rss_end": None, "peak_rss": None,
+        "peak_rss_increase": None, "bytes_read": None, "error": None,
+    }
+    peak_start, read_start = _peak_rss(), _bytes_read()
+    stack.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as error:
+        record["error"] = repr(error)
+        raise
+    finally:
+        record["wall_s"] = time.perf_counter() - start
+        stack.pop()
+        record["rss_end"] = _rss()
+        record["peak_rss"] = _peak_rss()
+        record["peak_rss_increase"] = _delta(record["peak_rss"], peak_start)
+        record["bytes_read"] = _delta(_bytes_read(), read_start)
+        _write(record)
+
+
+def profiled(name=None, rows_in=None):
+    """
+    Decorator recording every call of a function as a stage (see stage)
+
+    name: stage name, defaults to the function name
+    rows_in: function of the call arguments returning the number of input rows (e.g. lambda tifs, gdf, *a, **k: len(gdf))
+    """
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _TRACE["enabled"]:
+                return function(*args, **kwargs)
+            with stage(stage_name, rows_in(*args, **kwargs) if rows_in is not None else None) as record:
+                output = function(*args, **kwargs)
+                record["rows_out"] = count_rows(output)
+            return output
+
+        return wrapper
+
+    return decorator
+
+
+def progress(iterable, desc=None, total=None):
+    """
+    Wrap an iterable with a tqdm progress bar when tracing with progress=True (and tqdm is installed)
+    """
+    if not _TRACE["progress"]:
+        return iterable
+    try:
+        from tqdm.auto import tqdm
+    except ImportError:
+        return iterable
+    return tqdm(iterable, desc=desc, total=total)
+
+
+if os.environ.get(TRACE_ENV):
+    enable_trace(os.environ[TRACE_ENV])
@@ -0,0 +1,155 @@
+import pandas as pd
+
+from src.helpers import GDP_COLUMNS, WIND_COLUMNS, name_dtypes
+
+# Declared output columns and dtypes of every cleaner (besides the State and County Name categoricals).
+# Metrics are float32, counts that are never missing are int32, the county key index is int32.
+SCHEMAS = {
+    "wind": dict.fromkeys(WIND_COLUMNS, "float32"),
+    "gdp": {**dict.fromkeys(GDP_COLUMNS, "float32"), "Population Estimate": "int32"},
+    "solar": dict.fromkeys(
+        [
+            f"{metric} {size}"
+            for size in ["all", "small", "medium", "large"]
+            for metric in ["Solar MW 1000 sq mile", "Solar Projects 1000 sq mile", "Solar MW Avg 1000 sq mile"]
+        ],
+        "float32",
+    ),
+    "solar_roof": dict.fromkeys(
+        [
+            "Number of Existing Installs", "Total Installed Capacity (kW)", "Median Installed Capacity (kW)",
+            "Total Installed Capacity (kW/ 1000 sq mile)", "Median Installed Capacity (kW / sq mile)",
+            "Number of Existing Installs / sq mile",
+        ],
+        "float32",
+    ),
+    "private_schools": {"No. of Private Schools": "int32"},
+    "income": {"Median Income": "float32"},
+    "unemployment": {"Total Unemployment": "float32", "Unemployment Rate": "float32"},
+    "race": dict.fromkeys(
+        [
+            "Hispanic/Latino", "White", "Black/African American", "American Indian/Alaska Native", "Asian",
+            "Native Hawaiian/Other Pacific Islander", "Others",
+        ],
+        "float32",
+    ),
+    "race_acs": dict.fromkeys(
+        [
+            "White", "Black/African American", "American Indian/Alaska Native", "Asian",
+            "Native Hawaiian/Other Pacific Islander", "Other",
+        ],
+        "float32",
+    ),
+    "election": dict.fromkeys(
+        [
+            "democrat_percentage_vote", "republican_percentage_vote", "green_percentage_vote",
+            "libertarian_percentage_vote", "other_percentage_vote",
+        ],
+        "float32",
+    ),
+    "education_18_24": dict.fromkeys(
+        [
+            "18-24 Less than high school graduate", "18-24 High school graduate",
+            "18-24 Some college or associate's degree", "18-24 Bachelor's degree or higher",
+        ],
+        "float32",
+    ),
+    "education_25_over": dict.fromkeys(
+        [
+            "25+ Less than 9th grade", "25+ 9th to 12th grade, no diploma", "25+ High school graduate",
+            "25+ Some college, no degree", "25+ Associate's degree", "25+ Bachelor's degree",
+            "25+ Graduate or professional degree", "25+ High school graduate or higher",
+            "25+ Bachelor's degree or higher",
+        ],
+        "float32",
+    ),
+    "electric": dict.fromkeys(
+        ["Electric Commercial Rate", "Electric Industrial Rate", "Electric Residential Rate"], "float32"
+    ),
+    "electric_eia": dict.fromkeys(
+        [
+            "No. Commercial Customers", "Commercial Sales MWH", "Commercial Sales Revenue",
+            "No. Residential Customers", "Residential Sales MWH", "Residential Sales Revenue",
+        ],
+        "float32",
+    ),
+    "rural_urban": {"Rural Area Percentage": "float32", "Urban Area Percentage": "float32"},
+    # block group tables (src/block_group.py), indexed by the 12 digit GEOID
+    "race_bg": dict.fromkeys(
+        [
+            "Total Population", "Total One Race Percentage", "White Only Percentage",
+            "African American Only Percentage", "American Indian and Alaska Native Only Percentage",
+            "Asain Only Percentage", "Native Hawaiian and Other Pacific Islander Only Percentage",
+            "Others Only Percentage", "Total Mixed Raced Percentage",
+        ],
+        "float32",
+    ),
+    "unemployment_bg": dict.fromkeys(
+        [
+            "Total", "In labor force", "Civilian labor force", "Employed", "Unemployed", "Armed Forces",
+            "Not in labor force", "Unemployment Rate",
+        ],
+        "float32",
+    ),
+    "income_bg": {"Median Household Income": "float32"},
+    "solar_bg": dict.fromkeys(
+        [
+            "Average Project Size", "Average Project Size per km2", "Average Project Size per mi2",
+            "Capacity Intensity per km2", "Capacity Intensity per mi2", "Project Intensity per km2",
+            "Project Intensity per mi2", "area km2", "area mi2",
+        ],
+        "float32",
+    ),
+}
+
+
+def schema_dtypes(name):
+    """
+    Dtype of every column of a cleaner output, the names included
+
+    name: name of the schema in SCHEMAS, or a list of names for frames combining several cleaners
+    """
+    dtypes = dict(name_dtypes())
+    for schema in [name] if isinstance(name, str) else name:
+        dtypes.update(SCHEMAS[schema])
+    return dtypes
+
+
+def apply_schema(df, name):
+    """
+    Cast a cleaned frame to its declared schema
+
+    df: the cleaned frame (only the columns it has are cast, so subsets of a schema are fine)
+    name: name of the schema in SCHEMAS (or a list of names, see schema_dtypes)
+
+    Numbers still stored as strings are parsed, unparsable values (e.g. "-", "*****") become NaN.
+    """
+    dtypes = schema_dtypes(name)
+    df = df.copy()
+    for column in df.columns:
+        dtype = dtypes.get(column)
+        if dtype is None or isinstance(dtype, pd.CategoricalDtype):
+            continue
+        if not pd.api.types.is_numeric_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+    return df.astype({column: dtype for column, dtype in dtypes.items() if column in df.columns})
+
+
+def validate(df, name):
+    """
+    Check that a cleaned frame only has the columns of its schema, with the declared dtypes
+
+    Raises a ValueError listing every unexpected column and every wrong dtype.
+    """
+    dtypes = schema_dtypes(name)
+    errors = [f"unexpected column {column!r}" for column in df.columns if column not in dtypes]
+    errors += [
+        f"{column!r} is {df[column].dtype}, expected {dtypes[column]}"
+        for column in df.columns
+        if column in dtypes and df[column].dtype != dtypes[column]
+    ]
+    if df.index.name == "FIPS" and df.index.dtype != "int32":
+        errors.append(f"the county key is {df.index.dtype}, expected int32")
+    if errors:
+        raise ValueError(f"{name} does not match its schema: " + "; ".join(errors))
+    return df
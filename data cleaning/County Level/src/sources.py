@@ -0,0 +1,68 @@
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from src.profiling import add_rows_in
+
+# Maximum number of parsed raw tables kept in memory at once
+MAX_CACHED_SOURCES = 16
+
+_SOURCE_CACHE = OrderedDict()
+# the pipeline runs cleaners on several threads
+_SOURCE_LOCK = threading.Lock()
+
+
+def _cached_read(reader, datapath, **kwargs):
+    """
+    Parse a raw source file at most once per process and hand out copies
+
+    reader: the function used to parse the file (e.g. pd.read_csv)
+    datapath: path to the raw file
+    kwargs: keyword arguments forwarded to the reader
+    """
+    path = os.path.abspath(datapath)
+    mtime = os.path.getmtime(path)
+    key = (reader.__module__, reader.__name__, path, mtime, repr(sorted(kwargs.items())))
+
+    with _SOURCE_LOCK:
+        if key in _SOURCE_CACHE:
+            _SOURCE_CACHE.move_to_end(key)
+            table = _SOURCE_CACHE[key]
+            add_rows_in(len(table))
+            return table.copy()
+
+    table = reader(path, **kwargs)
+    with _SOURCE_LOCK:
+        # drop entries parsed from an older version of the same file
+        for stale in [k for k in _SOURCE_CACHE if k[2] == path and k[3] != mtime]:
+            del _SOURCE_CACHE[stale]
+        _SOURCE_CACHE[key] = table
+        while len(_SOURCE_CACHE) > MAX_CACHED_SOURCES:
+            _SOURCE_CACHE.popitem(last=False)
+
+    # the cleaners modify their input in place so never give out the cached frame
+    add_rows_in(len(table))
+    return table.copy()
+
+
+def read_csv(datapath, **kwargs):
+    """
+    Cached drop-in for pd.read_csv keyed on the path, modification time and read options
+    """
+    return _cached_read(pd.read_csv, datapath, **kwargs)
+
+
+def read_file(datapath, **kwargs):
+    """
+    Cached drop-in for gpd.read_file keyed on the path, modification time and read options
+    """
+    import geopandas as gpd
+
+    return _cached_read(gpd.read_file, datapath, **kwargs)
+
+
+def clear_source_cache():
+    with _SOURCE_LOCK:
+        _SOURCE_CACHE.clear()
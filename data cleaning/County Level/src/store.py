@@ -0,0 +1,152 @@
+import os
+
+import pandas as pd
+
+from src.CONSTANTS import get_file_path, get_source_file_path, data_file_mappings_store
+
+# Column the stored tables are partitioned on (two digit state FIPS code)
+PARTITION_COLUMN = "STATEFP"
+
+# Zero-padded width of the geographic code columns, they are stored as strings
+CODE_WIDTHS = {
+    "STATEFP": 2,
+    "COUNTYFP": 3,
+    "TRACTCE": 6,
+    "BLKGRPCE": 1,
+    "FIPS State": 2,
+    "FIPS County": 3,
+}
+
+
+#### Codes #####
+def normalize_code(values, width):
+    """
+    Zero-padded string codes from codes read as numbers or strings (e.g. 1.0 -> "01")
+
+    values: Series of codes
+    width: number of digits of the code
+    """
+    codes = values.astype("string").str.strip().str.replace(r"\.0+$", "", regex=True)
+    return codes.str.zfill(width)
+
+
+def normalize_geoid(values):
+    """
+    Zero-padded GEOIDs: at most 5 digits is a county code, longer ones are block group codes
+    """
+    codes = normalize_code(values, 0)
+    return codes.str.zfill(5).where(codes.str.len() <= 5, codes.str.zfill(12))
+
+
+def normalize_codes(df):
+    """
+    Store every known code column of df as zero-padded strings
+    """
+    for col, width in CODE_WIDTHS.items():
+        if col in df.columns:
+            df[col] = normalize_code(df[col], width)
+    if "GEOID" in df.columns:
+        df["GEOID"] = normalize_geoid(df["GEOID"])
+    return df
+
+
+def state_codes(df):
+    """
+    Two digit state FIPS code of every row, taken from the first code column available
+    (STATEFP, FIPS State, GEOID, a FIPS index or the State name)
+    """
+    if "STATEFP" in df.columns:
+        return normalize_code(df["STATEFP"], 2)
+    if "FIPS State" in df.columns:
+        return normalize_code(df["FIPS State"], 2)
+    if "GEOID" in df.columns:
+        return normalize_geoid(df["GEOID"]).str[:2]
+    if df.index.name == "FIPS":
+        return pd.Series(df.index // 1000, index=df.index).astype("string").str.zfill(2)
+    if "State" in df.columns:
+        from src.helpers import fips_table
+
+        names = fips_table().drop_duplicates("State").set_index("State")["FIPS State"]
+        return df["State"].map(names).astype("string").str.zfill(2)
+    raise ValueError("No column to derive the state FIPS code from")
+
+
+#### Store #####
+def write_table(df, name, path=None):
+    """
+    Write a cleaned table to the Parquet store, partitioned by state FIPS code
+
+    df: the table
+    name: name of the table in CONSTANTS.data_file_mappings_store
+    path: folder of the dataset (defaults to get_file_path(name))
+
+    The partitions of the states present in df are replaced, the others are kept.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = path or get_file_path(name)
+    table = normalize_codes(df.copy())
+    table[PARTITION_COLUMN] = state_codes(table).fillna("__missing__")
+
+    pq.write_to_dataset(
+        pa.Table.from_pandas(table, preserve_index=df.index.name is not None),
+        path,
+        partition_cols=[PARTITION_COLUMN],
+        existing_data_behavior="delete_matching",
+    )
+    return path
+
+
+def read_table(name, columns=None, states=None, filters=None, path=None):
+    """
+    Read a table from the Parquet store
+
+    name: name of the table in CONSTANTS.data_file_mappings_store
+    columns: columns to read (all when None)
+    states: state FIPS codes (e.g. ["06", "48"]) to read, only their partitions are opened
+    filters: extra row filters, in the pyarrow.parquet filters format (e.g. [("GEOID", "in", ids)])
+    path: folder of the dataset (defaults to get_file_path(name))
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    path = path or get_file_path(name)
+    partitioning = ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive")
+    dataset = ds.dataset(path, format="parquet", partitioning=partitioning)
+
+    expression = None
+    if states is not None:
+        expression = ds.field(PARTITION_COLUMN).isin([str(state).zfill(2) for state in states])
+    if filters:
+        extra = pq.filters_to_expression(filters)
+        expression = extra if expression is None else expression & extra
+
+    df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+    if PARTITION_COLUMN in df.columns and df[PARTITION_COLUMN].dtype == "category":
+        df[PARTITION_COLUMN] = df[PARTITION_COLUMN].astype("string")
+    return df
+
+
+def convert_csv(name, path=None):
+    """
+    Convert the source CSV of a stored table (CONSTANTS.data_file_mappings_store_sources) to Parquet
+
+    The code columns are read as strings so that leading zeros survive.
+    """
+    source = get_source_file_path(name)
+    header = pd.read_csv(source, nrows=0).columns
+    codes = {col: str for col in list(CODE_WIDTHS) + ["GEOID"] if col in header}
+    df = pd.read_csv(source, dtype=codes, low_memory=False)
+    return write_table(df, name, path)
+
+
+def convert_all():
+    """
+    Build the whole store from the source CSVs that exist
+    """
+    for name in data_file_mappings_store:
+        if os.path.exists(get_source_file_path(name)):
+            print(f"Converting {name}")
+            convert_csv(name)
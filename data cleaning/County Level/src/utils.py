@@ -1,12 +1,16 @@
-import geopandas as gpd
+import numpy as np
 import pandas as pd
+from src.CONSTANTS import SOLAR_SIZE_EDGES, SOLAR_SIZE_LABELS
 from src.helpers import *
+from src.profiling import profiled
+from src.schema import apply_schema
+from src.sources import read_csv, read_file
 
 state_abbreviations = get_state_abbr()
-FIPS = FIPS_getter()
 
 
 #### WIND CLEANING #####
+@profiled()
 def get_wind(datapath, fixed_BB):
     """
     Function to get the wind data
@@ -14,52 +18,21 @@ def get_wind(datapath, fixed_BB):
     datapath: path to the wind original wind data (i.e the shapefile)
     fixed_BB: the fixed bounding box dataframe
     """
-    data = gpd.read_file(datapath)
-    wind_sum_mw = (
-        data[["county", "statename", "wind_mw"]]
-        .groupby(["statename", "county"])
-        .sum()
-        .reset_index()
-        .rename(
-            columns={
-                "statename": "State",
-                "county": "County Name",
-                "wind_mw": "total_wind_mw",
-            }
-        )
-    )
-    wind_avg_mw = (
-        data[["county", "statename", "wind_mw"]]
-        .groupby(["statename", "county"])
-        .mean()
-        .reset_index()
-        .rename(
-            columns={
-                "statename": "State",
-                "county": "County Name",
-                "wind_mw": "avg_wind_mw",
-            }
-        )
-    )
-    wind_project_count = (
-        data.groupby(["statename", "county"])
-        .count()
-        .reset_index()[["statename", "county", "plant_code"]]
-        .rename(
-            columns={
-                "statename": "State",
-                "county": "County Name",
-                "plant_code": "wind_count",
-            }
-        )
-    )
+    data = read_file(datapath)
+    # projects are grouped by the county key looked up from their state and county names
+    data["county_fips"] = key_from_names(data, fixed_BB, state_col="statename", county_col="county")
 
     wind_df = (
-        wind_sum_mw.merge(fixed_BB, on=["State", "County Name"], how="left")
-        .merge(wind_avg_mw, on=["State", "County Name"], how="left")
-        .merge(wind_project_count, on=["State", "County Name"], how="left")
+        data.groupby("county_fips")
+        .agg(
+            total_wind_mw=("wind_mw", "sum"),
+            avg_wind_mw=("wind_mw", "mean"),
+            wind_count=("plant_code", "count"),
+        )
         .fillna(0)
     )
+    wind_df = set_county_key(wind_df, wind_df.index)
+    wind_df = wind_df.join(area_by_key(fixed_BB), how="inner")
 
     wind_df["Wind Capacity Intensity (MW / 1000 sq mile)"] = (
         wind_df["total_wind_mw"] / wind_df["area mi2"] * 1000
@@ -73,22 +46,22 @@ def get_wind(datapath, fixed_BB):
     )
 
     wind_df = wind_df.drop(
-        columns=["GEOID", "total_wind_mw", "wind_count", "avg_wind_mw"]
+        columns=["area mi2", "total_wind_mw", "wind_count", "avg_wind_mw"]
     )
 
-    return wind_df
+    return apply_schema(wind_df, "wind")
 
 #### Solar Roof Data #####
+@profiled()
 def get_solar_roof_data(datapath, fixed_BB):
-    data = pd.read_csv(datapath)
+    data = read_csv(datapath)
     solar_roof = data.groupby(["region_name", "state_name"]).sum().reset_index()[['region_name', 'state_name', 'existing_installs_count', 'kw_total', 'kw_median']]
 
     solar_roof = solar_roof.rename(columns = {'region_name': 'County Name', 'state_name': 'State', 'existing_installs_count': 'Number of Existing Installs', 'kw_total': 'Total Installed Capacity (kW)', 'kw_median': 'Median Installed Capacity (kW)'})
 
-    solar_roof['County Name'] = solar_roof['County Name'].str.replace(' County', '').str.replace(' Parish', '').str.replace(".", "")
-    
-    # Merge wth the fixed bounding box to get the area
-    solar_roof = solar_roof.merge(fixed_BB, on=['State', 'County Name'], how='inner')
+    # Look up the county key by name (ignoring ' County', ' Parish' and '.') and get the area
+    solar_roof = set_county_key(solar_roof, key_from_names(solar_roof, fixed_BB))
+    solar_roof = solar_roof.join(area_by_key(fixed_BB), how='inner')
     
     # Normalize by area
     solar_roof['Total Installed Capacity (kW/ 1000 sq mile)'] = solar_roof['Total Installed Capacity (kW)'] / solar_roof['area mi2'] * 1000
@@ -102,14 +75,15 @@ def get_solar_roof_data(datapath, fixed_BB):
     solar_roof['Median Installed Capacity (kW / sq mile)'] = solar_roof['Median Installed Capacity (kW / sq mile)'].round(2)
     solar_roof['Number of Existing Installs / sq mile'] = solar_roof['Number of Existing Installs / sq mile'].round(2)
     
-    solar_roof = solar_roof.drop(columns=['GEOID', 'area mi2', 'area km2', 'FIPS State', 'FIPS County'])
+    solar_roof = solar_roof.drop(columns=['area mi2'])
     
-    return solar_roof
+    return apply_schema(solar_roof, "solar_roof")
 
 
 #### GDP CLEANING #####
 
 
+@profiled()
 def get_GDP(datapath, fixed_BB, pop_data):
     """
     Function to get the GDP data normalized by area
@@ -117,15 +91,15 @@ def get_GDP(datapath, fixed_BB, pop_data):
     datapath: path to the GDP data (cleaned csv)
     fixed_BB: the fixed bounding box dataframe
     """
-    gdp_data = pd.read_csv(datapath, dtype={'GeoFIPS': str})
-    pop_data = pd.read_csv(pop_data, dtype={"STATE": str, "COUNTY": str})
+    gdp_data = read_csv(datapath, dtype={'GeoFIPS': str})
+    pop_data = read_csv(pop_data, dtype={"STATE": str, "COUNTY": str})
     gdp_data['Description'] = gdp_data['Description'].str.strip()
     gdp_data = gdp_data[gdp_data["Description"] == "Real GDP (thousands of chained 2017 dollars)"]
     gdp_data['GeoFIPS'] = gdp_data['GeoFIPS'].str.strip().str.replace('"', '')
-    gdp_data['County FIPS'] = gdp_data['GeoFIPS'].str[2:]
-    gdp_data['State FIPS'] = gdp_data['GeoFIPS'].str[:2]
-    gdp_data = gdp_data.merge(fixed_BB, left_on=['State FIPS', 'County FIPS'], right_on=['FIPS State', 'FIPS County'], how='inner')
-    gdp_data = gdp_data.merge(pop_data, left_on=['State FIPS', 'County FIPS'], right_on=['STATE', 'COUNTY'], how='inner')
+    gdp_data = set_county_key(gdp_data, county_key(gdp_data['GeoFIPS']))
+    gdp_data = gdp_data[gdp_data.index.isin(area_by_key(fixed_BB).index)]
+    pop_data = set_county_key(pop_data, county_key(pop_data['STATE'], pop_data['COUNTY']))
+    gdp_data = gdp_data.join(pop_data[['POPESTIMATE2022']], how='inner')
     gdp_data_important = gdp_data[["State", "County Name", "2017", '2018', '2019', '2020', '2021', '2022', 'POPESTIMATE2022']]
     rename_dict = {
         '2017': 'GDP_2017',
@@ -136,150 +110,189 @@ def get_GDP(datapath, fixed_BB, pop_data):
         '2022': 'GDP_2022',
     }
     gdp_data_important = gdp_data_important.rename(columns=rename_dict)
-    # divide all numerical columns by county area
-    for col in rename_dict.values():
-        gdp_data_important[col] = gdp_data_important[col].astype("float32")
-        gdp_data_important[col] = gdp_data_important[col] / (gdp_data_important["POPESTIMATE2022"])
-        # round to 2 decimal places
-        gdp_data_important[col] = gdp_data_important[col].round(2)
+    # divide all GDP columns by the population, rounded to 2 decimal places
+    gdp_columns = list(rename_dict.values())
+    gdp_data_important[gdp_columns] = (
+        gdp_data_important[gdp_columns].apply(pd.to_numeric, errors="coerce")
+        .div(gdp_data_important["POPESTIMATE2022"], axis=0)
+        .round(2)
+    )
         
     gdp_data_important = gdp_data_important.rename(columns={'POPESTIMATE2022': 'Population Estimate'})
         
-    return gdp_data_important
+    return apply_schema(gdp_data_important, "gdp")
 
 
 #### Solar Cleaning #####
 
 
-def get_solar(datapath, fixed_BB, size="all"):
+@profiled()
+def get_solar_buckets(datapath, fixed_BB, edges=SOLAR_SIZE_EDGES, labels=SOLAR_SIZE_LABELS):
     """
-    Function to get the solar data normalized by area
+    Function to get the solar data normalized by area for every project size at once
 
     datapath: path to the solar data
     fixed_BB: the fixed bounding box dataframe
+    edges: capacity (MW) boundaries between the size buckets, a project on an edge goes in the bigger bucket
+    labels: names of the size buckets (one more than the number of edges)
+
+    Returns one wide dataframe with the 'all' columns followed by the columns of every bucket.
+    Counties without projects in a bucket have NaN for that bucket.
     """
-    solar = pd.read_csv(datapath)
+    edges = list(edges)
+    labels = list(labels)
+    if len(labels) != len(edges) + 1:
+        raise ValueError(f"Expected {len(edges) + 1} size labels for edges {edges}, got {labels}")
+
+    solar = read_csv(datapath)
     solar = solar[["statename", "county", "solar_mw"]]
+    solar["county_fips"] = key_from_names(solar, fixed_BB, state_col="statename", county_col="county")
+
+    # bucket code of every project, -1 for projects without a capacity
+    solar["bucket"] = pd.cut(
+        solar["solar_mw"], bins=[-np.inf] + edges + [np.inf], right=False
+    ).cat.codes
+
+    # a single aggregation for all the buckets
+    stats = (
+        solar.groupby(["county_fips", "bucket"])["solar_mw"]
+        .agg(["sum", "count"])
+        .unstack("bucket")
+    )
+    sums = stats["sum"]
+    counts = stats["count"]
+
+    solar_merged = pd.DataFrame(index=stats.index)
+    sizes = ["all"] + labels
+    for code, size in enumerate(sizes, start=-1):
+        if size == "all":
+            size_sum = sums.sum(axis=1)
+            size_count = counts.sum(axis=1)
+        else:
+            size_sum = sums.get(code)
+            size_count = counts.get(code)
+            if size_sum is None:
+                size_sum = size_count = pd.Series(np.nan, index=stats.index)
+        solar_merged["solar_mw_sum_" + size] = size_sum
+        solar_merged["solar_mw_avg_" + size] = size_sum / size_count
+        solar_merged["solar_mw_count_" + size] = size_count
+
+    solar_with_area = set_county_key(solar_merged, solar_merged.index).join(
+        area_by_key(fixed_BB), how="inner"
+    )
+
+    columns = ["State", "County Name"]
+    for size in sizes:
+        solar_with_area["Solar MW 1000 sq mile " + size] = (
+            solar_with_area["solar_mw_sum_" + size] / solar_with_area["area mi2"] * 1000
+        )
+        solar_with_area["Solar Projects 1000 sq mile " + size] = (
+            solar_with_area["solar_mw_count_" + size] / solar_with_area["area mi2"] * 1000
+        )
+        solar_with_area["Solar MW Avg 1000 sq mile " + size] = (
+            solar_with_area["solar_mw_avg_" + size] / solar_with_area["area mi2"] * 1000
+        )
+        columns += [
+            "Solar MW 1000 sq mile " + size,
+            "Solar Projects 1000 sq mile " + size,
+            "Solar MW Avg 1000 sq mile " + size,
+        ]
 
-    if size == "all":
-        solar_grouped = solar.groupby(["statename", "county"])
-    elif size == "small":
-        solar_grouped = solar[solar["solar_mw"] < 5].groupby(["statename", "county"])
-    elif size == "medium":
-        solar_grouped = solar[
-            (solar["solar_mw"] >= 5) & (solar["solar_mw"] < 25)
-        ].groupby(["statename", "county"])
-    elif size == "large":
-        solar_grouped = solar[solar["solar_mw"] >= 25].groupby(["statename", "county"])
-    else:
-        raise ValueError(f"Invalid size type: {size}")
+    return apply_schema(solar_with_area[columns], "solar")
 
-    solar_sum_all = solar_grouped.sum().reset_index()
-    solar_avg_all = solar_grouped.mean().reset_index()
-    solar_count_all = solar_grouped.count().reset_index()
 
-    solar_merged = solar_sum_all.merge(
-        solar_avg_all, on=["statename", "county"], suffixes=("_sum", "_avg")
-    ).merge(solar_count_all, on=["statename", "county"])
+@profiled()
+def get_solar(datapath, fixed_BB, size="all", edges=SOLAR_SIZE_EDGES):
+    """
+    Function to get the solar data normalized by area
 
-    solar_merged.columns = [
-        "state",
-        "county",
-        "solar_mw_sum_" + size,
-        "solar_mw_avg_" + size,
-        "solar_mw_count_" + size,
-    ]
+    datapath: path to the solar data
+    fixed_BB: the fixed bounding box dataframe
+    size: 'all' or one of the size buckets ('small', 'medium', 'large')
+    edges: capacity (MW) boundaries between the size buckets
+    """
+    if size != "all" and size not in SOLAR_SIZE_LABELS:
+        raise ValueError(f"Invalid size type: {size}")
 
-    solar_with_area = (
-        solar_merged.rename(columns={"state": "State", "county": "County Name"})
-        .merge(fixed_BB, on=["State", "County Name"])
-        .drop(columns=["GEOID"])
-    )
-    solar_with_area["Solar MW 1000 sq mile " + size] = (
-        solar_with_area["solar_mw_sum_" + size] / solar_with_area["area mi2"] * 1000
-    )
-    solar_with_area["Solar Projects 1000 sq mile " + size] = (
-        solar_with_area["solar_mw_count_" + size] / solar_with_area["area mi2"] * 1000
-    )
+    return solar_size(get_solar_buckets(datapath, fixed_BB, edges=edges), size)
 
-    solar_with_area["Solar MW Avg 1000 sq mile " + size] = (
-        solar_with_area["solar_mw_avg_" + size] / solar_with_area["area mi2"] * 1000
-    )
 
-    return solar_with_area[
-        [
-            "State",
-            "County Name",
-            "Solar MW 1000 sq mile " + size,
-            "Solar Projects 1000 sq mile " + size,
-            "Solar MW Avg 1000 sq mile " + size,
-        ]
+def solar_size(solar, size):
+    """
+    Columns of one size bucket of the get_solar_buckets output
+
+    solar: the get_solar_buckets dataframe
+    size: 'all' or one of the size buckets
+    """
+    columns = [
+        "Solar MW 1000 sq mile " + size,
+        "Solar Projects 1000 sq mile " + size,
+        "Solar MW Avg 1000 sq mile " + size,
     ]
 
+    # only keep the counties that have projects of this size
+    solar = solar.dropna(subset=["Solar Projects 1000 sq mile " + size])
 
-#### ELECTRIC CLEANING ####
-def get_electric(datapath, customer_class):
-    data = pd.read_csv(datapath, dtype={"utility_id_eia": str})  # read data
-    # Get the important columns
-    data = data[
-        ["utility_id_eia", "customer_class", "customers", "sales_mwh", "sales_revenue"]
-    ]
+    return solar[["State", "County Name"] + columns]
 
-    # As the county FIPS in the pudl data is the state and county number merge create that column
-    FIPS_temp = FIPS.copy()
-    FIPS_temp["FIPS Full"] = (
-        FIPS_temp["FIPS State"].astype(int).astype(str) + FIPS_temp["FIPS County"]
-    )
-    FIPS_temp = FIPS_temp.drop(columns=["FIPS State", "FIPS County"])
 
-    # Merge to get the county names
-    data_with_county = data.merge(
-        EIA_FIPS_getter(), on="utility_id_eia", how="left"
-    ).drop(columns=["utility_id_eia"])
+#### ELECTRIC CLEANING ####
+# Sales columns of the EIA sales data and their names for every customer class
+ELECTRIC_VALUES = {"customers": "No. {} Customers", "sales_mwh": "{} Sales MWH", "sales_revenue": "{} Sales Revenue"}
+CUSTOMER_CLASSES = ["commercial", "residential"]
 
-    # Get the commercial data only and the residential data only
-    data_com = data_with_county[data_with_county["customer_class"] == "commercial"]
-    data_res = data_with_county[data_with_county["customer_class"] == "residential"]
 
-    # Grouby the county_fips_id and sum to get the total electric price consumptions
-    data_com_summed = (
-        data_com.groupby("county_id_fips")
-        .sum()
-        .reset_index()
-        .drop(columns=["customer_class"])
-    )
-    data_res_summed = (
-        data_res.groupby("county_id_fips")
-        .sum()
-        .reset_index()
-        .drop(columns=["customer_class"])
-    )
+@profiled()
+def get_electric(datapath, customer_class, weighting=None):
+    """
+    Customers, sales and revenue of the utilities serving every county (EIA sales data)
 
-    # Merge with FIPS to get the county and state name for the respective county fips id
-    data_com_summed = data_com_summed.merge(
-        FIPS_temp, left_on="county_id_fips", right_on="FIPS Full", how="left"
-    )
-    data_res_summed = data_res_summed.merge(
-        FIPS_temp, left_on="county_id_fips", right_on="FIPS Full", how="left"
-    )
-    
-    # Rename for Commercial
-    data_com_summed = data_com_summed.rename(columns={'sales_revenue': 'Commercial Sales Revenue', 'sales_mwh': 'Commercial Sales MWH', 'customers': 'No. Commercial Customers'}).drop(columns=['FIPS Full', 'county_id_fips'])
-    # Rename for Residential
-    data_res_summed = data_res_summed.rename(columns={'sales_revenue': 'Residential Sales Revenue', 'sales_mwh': 'Residential Sales MWH', 'customers': 'No. Residential Customers'}).drop(columns=['FIPS Full', 'county_id_fips'])
-    
-    if customer_class == 'commercial':
-        return data_com_summed
-    elif customer_class == 'residential':
-        return data_res_summed
-    elif customer_class == 'both':
-        return {'commercial': data_com_summed, 'residential': data_res_summed}
-    else:
+    datapath: path to the EIA sales data
+    customer_class: 'commercial', 'residential' or 'both' (a dict of the two frames)
+    weighting: how the sales of a utility serving several counties are attributed to them, None gives
+        every county the utility totals, 'equal' splits them evenly between its counties
+    """
+    if customer_class not in CUSTOMER_CLASSES + ["both"]:
         raise ValueError(f"Invalid customer class {customer_class}")
-    
-
+    if weighting not in [None, "equal"]:
+        raise ValueError(f"Invalid weighting {weighting}")
+    classes = CUSTOMER_CLASSES if customer_class == "both" else [customer_class]
+    values = list(ELECTRIC_VALUES)
+
+    data = read_csv(datapath, usecols=["utility_id_eia", "customer_class"] + values)
+    data = data[data["customer_class"].isin(classes)]
+    data["utility_id_eia"] = pd.to_numeric(data["utility_id_eia"], errors="coerce")
+
+    # totals of every utility and class, then joined on the integer utility id to the counties it serves
+    groups = data.groupby(["utility_id_eia", "customer_class"])
+    totals = groups[values].sum().assign(rows=groups.size()).reset_index()
+    totals = totals.merge(utility_counties(), on="utility_id_eia")
+    if weighting == "equal":
+        totals[values] = totals[values].mul(totals["weight"], axis=0)
+
+    # every class side by side in a single aggregation
+    by_county = (
+        totals.groupby([COUNTY_KEY, "customer_class"])[values + ["rows"]].sum()
+        .unstack("customer_class")
+        .reindex(columns=pd.MultiIndex.from_product([values + ["rows"], classes]))
+    )
+
+    frames = {}
+    for name in classes:
+        frame = by_county.xs(name, axis=1, level=1)
+        # only the counties served by a utility with sales in the class
+        frame = frame[frame["rows"] > 0].drop(columns="rows")
+        frame = frame.rename(columns={value: label.format(name.capitalize()) for value, label in ELECTRIC_VALUES.items()})
+        frames[name] = apply_schema(set_county_key(frame, frame.index), "electric_eia")
+
+    if customer_class == "both":
+        return frames
+    return frames[customer_class]
+
+
+@profiled()
 def NREL_Electric(datapath):
-    data = pd.read_csv(datapath)
+    data = read_csv(datapath)
     NREL_AVG = data[['State', 'County Name', 'comm_rate', 'ind_rate', 'res_rate']].groupby(['State', 'County Name']).mean().reset_index()
     
     rename_dict = {
@@ -288,13 +301,15 @@ def NREL_Electric(datapath):
         "res_rate": "Electric Residential Rate"
     }
     NREL_AVG = NREL_AVG.rename(columns=rename_dict)
+    NREL_AVG = set_county_key(NREL_AVG, key_from_names(NREL_AVG))
     
-    return NREL_AVG
+    return apply_schema(NREL_AVG, "electric")
 
 
 #### Education Level Cleaning #####
+@profiled()
 def get_education_18_24(datapath):
-    data = pd.read_csv(datapath)
+    data = read_csv(datapath)
 
     # make the first row the header as first row contains more meaningful column names
     data.columns = data.iloc[0]
@@ -320,12 +335,9 @@ def get_education_18_24(datapath):
     # get all columns that include the word 'estimate' and '18 to 24 years'
     data_18_24_estimates = data.loc[:, important_columns_18_24]
     state_counties = data.loc[:, ["Geographic Area Name", "Geography"]]
-    state_counties["FIPS State"] = state_counties["Geography"].apply(
-        lambda x: x.split("US")[1][:2]
-    )
-    state_counties["FIPS County"] = state_counties["Geography"].apply(
-        lambda x: x.split("US")[1][2:]
-    )
+    state_counties[["FIPS State", "FIPS County"]] = decode_geoid(state_counties["Geography"])[
+        ["FIPS State", "FIPS County"]
+    ]
 
     data_18_24_estimates = (
         pd.concat([state_counties, data_18_24_estimates], axis=1)
@@ -334,25 +346,22 @@ def get_education_18_24(datapath):
                 "Geographic Area Name",
                 "Estimate!!Percent!!AGE BY EDUCATIONAL ATTAINMENT!!Population 18 to 24 years",
             ],
-            axis=1,
         )
         .rename(columns=rename_dict)
     )
-    data_18_24_estimates = data_18_24_estimates.merge(
-        FIPS,
-        left_on=["FIPS State", "FIPS County"],
-        right_on=["FIPS State", "FIPS County"],
-        how="inner",
+    data_18_24_estimates = set_county_key(
+        data_18_24_estimates, county_key(data_18_24_estimates["FIPS State"], data_18_24_estimates["FIPS County"])
     )
     data_18_24_estimates = data_18_24_estimates.drop(
         columns=["FIPS State", "FIPS County", "Geography"]
     )
 
-    return data_18_24_estimates
+    return apply_schema(data_18_24_estimates, "education_18_24")
 
 
+@profiled()
 def get_education_25_over(datapath):
-    data = pd.read_csv(datapath)
+    data = read_csv(datapath)
 
     # make the first row the header as first row contains more meaningful column names
     data.columns = data.iloc[0]
@@ -384,12 +393,9 @@ def get_education_25_over(datapath):
     # get all columns that include the word 'estimate' and '18 to 24 years'
     data_25_over_estimates = data.loc[:, important_columns_25_over]
     state_counties = data.loc[:, ["Geographic Area Name", "Geography"]]
-    state_counties["FIPS State"] = state_counties["Geography"].apply(
-        lambda x: x.split("US")[1][:2]
-    )
-    state_counties["FIPS County"] = state_counties["Geography"].apply(
-        lambda x: x.split("US")[1][2:]
-    )
+    state_counties[["FIPS State", "FIPS County"]] = decode_geoid(state_counties["Geography"])[
+        ["FIPS State", "FIPS County"]
+    ]
 
     data_25_over_estimates = (
         pd.concat([state_counties, data_25_over_estimates], axis=1)
@@ -398,31 +404,28 @@ def get_education_25_over(datapath):
                 "Geographic Area Name",
                 "Estimate!!Percent!!AGE BY EDUCATIONAL ATTAINMENT!!Population 25 years and over",
             ],
-            axis=1,
         )
         .rename(columns=rename_dict_25_over)
     )
 
-    data_25_over_estimates = data_25_over_estimates.merge(
-        FIPS,
-        left_on=["FIPS State", "FIPS County"],
-        right_on=["FIPS State", "FIPS County"],
-        how="inner",
+    data_25_over_estimates = set_county_key(
+        data_25_over_estimates, county_key(data_25_over_estimates["FIPS State"], data_25_over_estimates["FIPS County"])
     )
     data_25_over_estimates = data_25_over_estimates.drop(
         columns=["FIPS State", "FIPS County", "Geography"]
     )
 
-    return data_25_over_estimates
+    return apply_schema(data_25_over_estimates, "education_25_over")
 
 
 #### Private Schools #####
+@profiled()
 def get_no_priv_schools(datapath):
-    data = pd.read_csv(datapath, dtype={"CNTY": str, "STFIP": str})
+    data = read_csv(datapath, dtype={"CNTY": str, "STFIP": str})
     data_clean = data[["NAME", "STFIP", "CNTY"]].copy()
 
     # Get the County FIPS which is the last 3 digits of the STFIP
-    data_clean["FIPS County"] = data_clean["CNTY"].apply(lambda x: str(x)[-3:])
+    data_clean["FIPS County"] = data_clean["CNTY"].str[-3:]
     data_clean = data_clean.rename(columns={"STFIP": "FIPS State"})
 
     no_priv_sch = (
@@ -432,22 +435,19 @@ def get_no_priv_schools(datapath):
         .rename(columns={"CNTY": "No. of Private Schools"})
     )
     no_priv_sch["FIPS State"] = no_priv_sch["FIPS State"]
-    no_priv_sch = no_priv_sch.merge(
-        FIPS,
-        left_on=["FIPS State", "FIPS County"],
-        right_on=["FIPS State", "FIPS County"],
-        how="inner",
+    no_priv_sch = set_county_key(
+        no_priv_sch, county_key(no_priv_sch["FIPS State"], no_priv_sch["FIPS County"])
     )
     no_priv_sch = no_priv_sch.drop(columns=["FIPS State", "FIPS County"])
 
-    return no_priv_sch
+    return apply_schema(no_priv_sch, "private_schools")
 
 
 #### Race Distribution #####
+@profiled()
 def get_race_dec(datapath):
-    df = pd.read_csv(datapath)  # read the data
-    df.columns = df.iloc[0]
-    df = df[1:]
+    # the second row holds the column labels, counts are parsed as numbers while reading
+    df = read_csv(datapath, header=1, thousands=",")
     col_of_interest = (
         list(df.columns[1:4])
         + [col for col in df.columns[:-1] if "Population of one race:!" in col]
@@ -463,18 +463,13 @@ def get_race_dec(datapath):
         .str.replace("!!Not Hispanic or Latino", "")
         .str.strip()
     )
-    df_totals = df_totals.set_index("Geography")
-    df_totals = df_totals.apply(to_int)
+    df_totals = df_totals.set_index("Geography").astype(float)
     df_totals = (
         df_totals.div(df_totals["Total"], axis=0).drop(columns=["Total"]).reset_index()
     )
-    df_totals["FIPS State"] = df_totals["Geography"].apply(
-        lambda x: x.split("US")[1][:2]
-    )
-
-    df_totals["FIPS County"] = df_totals["Geography"].apply(
-        lambda x: x.split("US")[1][2:]
-    )
+    df_totals[["FIPS State", "FIPS County"]] = decode_geoid(df_totals["Geography"])[
+        ["FIPS State", "FIPS County"]
+    ]
 
     mapper = {
         "Total!!Hispanic or Latino": "Hispanic/Latino",
@@ -496,40 +491,33 @@ def get_race_dec(datapath):
         columns=["Total:!!Population of two or more races:!!Population of two races:"]
     )
 
-    df_cleaned = df_cleaned.merge(
-        FIPS,
-        left_on=["FIPS State", "FIPS County"],
-        right_on=["FIPS State", "FIPS County"],
-        how="inner",
+    df_cleaned = set_county_key(
+        df_cleaned, county_key(df_cleaned["FIPS State"], df_cleaned["FIPS County"])
     )
     df_cleaned = df_cleaned.drop(columns=["FIPS State", "FIPS County"])
-    return df_cleaned
+    return apply_schema(df_cleaned, "race")
 
 
+@profiled()
 def get_race_acs(datapath):
-    df = pd.read_csv(datapath)  # read the data
-    # maje first row the header
-    df.columns = df.iloc[0]
-    df = df[1:].drop(columns=[df.columns[-1]])
+    # the second row holds the column labels, counts are parsed as numbers while reading
+    df = read_csv(datapath, header=1, thousands=",")
+    df = df.drop(columns=[df.columns[-1]])
     estimate_cols = [col for col in df.columns if "Estimate" in col]
     df_estimates = df[["Geography"] + estimate_cols[: len(estimate_cols) - 2]]
     df_estimates.columns = df_estimates.columns.str.replace(
         "Estimate!!", ""
     ).str.replace("Total:!!", "")
     # divide all columns by the total population
-    df_estimates = df_estimates.set_index("Geography")
-    df_estimates = df_estimates.apply(to_int)
+    df_estimates = df_estimates.set_index("Geography").astype(float)
     df_estimates = (
         df_estimates.div(df_estimates["Total:"], axis=0)
         .drop(columns=["Total:"])
         .reset_index()
     )
-    df_estimates["FIPS State"] = df_estimates["Geography"].apply(
-        lambda x: x.split("US")[1][:2]
-    )
-    df_estimates["FIPS County"] = df_estimates["Geography"].apply(
-        lambda x: x.split("US")[1][2:]
-    )
+    df_estimates[["FIPS State", "FIPS County"]] = decode_geoid(df_estimates["Geography"])[
+        ["FIPS State", "FIPS County"]
+    ]
 
     mapper = {
         "Total:": "Total",
@@ -546,59 +534,36 @@ def get_race_acs(datapath):
         columns=["Geography", "Some other race alone", "Two or more races:"]
     ).rename(columns=mapper)
 
-    df_cleaned = df_cleaned.merge(
-        FIPS,
-        left_on=["FIPS State", "FIPS County"],
-        right_on=["FIPS State", "FIPS County"],
-        how="inner",
+    df_cleaned = set_county_key(
+        df_cleaned, county_key(df_cleaned["FIPS State"], df_cleaned["FIPS County"])
     )
     df_cleaned = df_cleaned.drop(columns=["FIPS State", "FIPS County"])
 
-    return df_cleaned
+    return apply_schema(df_cleaned, "race_acs")
 
 
 #### Election Distribution #####
 
 
+@profiled()
 def get_election(datapath, party="all"):
-    data = pd.read_csv(datapath, dtype={"county_fips": str})
-    data["county_fips"] = data["county_fips"].str[:-2]
-    data["FIPS County"] = data["county_fips"].apply(lambda x: str(x)[-3:].strip())
-
-    # state is not including the last three digits of the fips code
-    data["FIPS State"] = data["county_fips"].apply(lambda x: str(x)[:-3].strip())
-    county_vote = data[
-        [
-            "FIPS County",
-            "FIPS State",
-            "candidate",
-            "mode",
-            "party",
-            "candidatevotes",
-            "totalvotes",
-        ]
-    ]
-    FIPS_int = FIPS.copy()
-    FIPS_int["FIPS State"] = FIPS_int["FIPS State"].astype(int).astype(str)
+    data = read_csv(datapath, dtype={"county_fips": str})
+    # county_fips is the full state and county code written as a float (e.g. 1001.0)
+    data["county_fips"] = county_key(data["county_fips"])
+    county_vote = data[["county_fips", "party", "candidatevotes", "totalvotes"]]
 
     county_vote = (
-        county_vote.groupby(["FIPS County", "FIPS State", "party"]).sum().reset_index()
+        county_vote.groupby(["county_fips", "party"]).sum().reset_index()
     )
 
-    county_vote = county_vote.merge(
-        FIPS_int,
-        left_on=["FIPS State", "FIPS County"],
-        right_on=["FIPS State", "FIPS County"],
-        how="inner",
-    )
-
-    # Check of FIPS 1 and 001 is in the df
-    county_vote = county_vote.drop(columns=["FIPS State", "FIPS County"])
+    county_vote = set_county_key(county_vote, county_vote["county_fips"])
+    county_vote = county_vote.drop(columns=["county_fips"])
 
     county_vote["percentage_vote"] = (
         county_vote["candidatevotes"] / county_vote["totalvotes"]
     )
     county_vote = county_vote.drop(columns=["candidatevotes", "totalvotes"])
+    county_vote["percentage_vote"] = county_vote["percentage_vote"].astype("float32")
 
     county_vote_democrat = county_vote[county_vote["party"] == "DEMOCRAT"][
         ["State", "County Name", "percentage_vote"]
@@ -646,8 +611,9 @@ def get_election(datapath, party="all"):
 
 
 #### Income Distribution #####
+@profiled()
 def get_income(datapath):
-    data = pd.read_csv(datapath)
+    data = read_csv(datapath)
     # make first row the header
     data.columns = data.iloc[0]
     data = data[1:].drop(columns=[data.columns[-1]])
@@ -660,28 +626,23 @@ def get_income(datapath):
     df_income_clean = df_estimates.rename(
         columns={"Estimate!!Households!!Median income (dollars)": "Median Income"}
     )
-    df_income_clean["FIPS State"] = df_income_clean["Geography"].apply(
-        lambda x: x.split("US")[1][:2]
-    )
-    df_income_clean["FIPS County"] = df_income_clean["Geography"].apply(
-        lambda x: x.split("US")[1][2:]
-    )
+    df_income_clean[["FIPS State", "FIPS County"]] = decode_geoid(df_income_clean["Geography"])[
+        ["FIPS State", "FIPS County"]
+    ]
 
-    df_income_clean = df_income_clean.merge(
-        FIPS,
-        left_on=["FIPS State", "FIPS County"],
-        right_on=["FIPS State", "FIPS County"],
-        how="inner",
+    df_income_clean = set_county_key(
+        df_income_clean, county_key(df_income_clean["FIPS State"], df_income_clean["FIPS County"])
     )
     df_income_clean = df_income_clean.drop(columns=["FIPS State", "FIPS County"])
 
     df_income_clean = df_income_clean.drop(columns=["Geography"]).drop_duplicates()
-    return df_income_clean
+    return apply_schema(df_income_clean, "income")
 
 
 #### Unemployment data #####
+@profiled()
 def get_unemployment(datapath):
-    data = pd.read_csv(datapath)
+    data = read_csv(datapath)
     # make the first row the header
     data.columns = data.iloc[0]
     data = data[1:]
@@ -713,19 +674,13 @@ def get_unemployment(datapath):
         }
     )
     # split the geography column into state and county
-    data_important["FIPS State"] = data_important["Geography"].apply(
-        lambda x: x.split("US")[1][:2]
-    )
-    data_important["FIPS County"] = data_important["Geography"].apply(
-        lambda x: x.split("US")[1][2:]
-    )
+    data_important[["FIPS State", "FIPS County"]] = decode_geoid(data_important["Geography"])[
+        ["FIPS State", "FIPS County"]
+    ]
     data_important = data_important.drop(columns=["Geography"])
 
-    data_important = data_important.merge(
-        FIPS,
-        left_on=["FIPS State", "FIPS County"],
-        right_on=["FIPS State", "FIPS County"],
-        how="inner",
+    data_important = set_county_key(
+        data_important, county_key(data_important["FIPS State"], data_important["FIPS County"])
     )
     data_important = data_important.drop(columns=["FIPS State", "FIPS County"])
     # reorder columns
@@ -733,18 +688,19 @@ def get_unemployment(datapath):
         ["State", "County Name", "Total Unemployment", "Unemployment Rate"]
     ]
 
-    return data_important
+    return apply_schema(data_important, "unemployment")
 
 
 #### Rural Urban Coverage #####
 
+@profiled()
 def get_rural_urban_coverage(datapath):
-    data = pd.read_csv(datapath, dtype={"STATE": str, "COUNTY": str})
+    data = read_csv(datapath, dtype={"STATE": str, "COUNTY": str})
     
     data_important = data[['STATE', 'COUNTY', "ALAND_PCT_RUR", "ALAND_PCT_URB"]]
     
-    data_merged = pd.merge(FIPS, data_important, left_on=['FIPS State', 'FIPS County'], right_on=['STATE', 'COUNTY'], how='inner')
-    data_merged = data_merged.drop(columns=['STATE', 'COUNTY', 'FIPS State', 'FIPS County'])
+    data_merged = set_county_key(data_important, county_key(data_important['STATE'], data_important['COUNTY']))
+    data_merged = data_merged.drop(columns=['STATE', 'COUNTY'])
     
     data_merged['ALAND_PCT_RUR'] = data_merged['ALAND_PCT_RUR'].str.rstrip('%').astype('float') / 100.0
     data_merged['ALAND_PCT_URB'] = data_merged['ALAND_PCT_URB'].str.rstrip('%').astype('float') / 100.0
@@ -756,7 +712,7 @@ def get_rural_urban_coverage(datapath):
     
     data_merged = data_merged.rename(columns=rename_dict)
     
-    return data_merged
+    return apply_schema(data_merged, "rural_urban")
     
     
     
@@ -0,0 +1,290 @@
+"""
+Synthetic inputs for the benchmarks
+
+write_county_data writes a data folder laid out like RAW_DATA_DIRECTORY (see County Level/src/CONSTANTS.py)
+with every file the county cleaners read, for any number of states, counties and projects.
+Counties are squares on a regular grid so the spatial fixtures (rasters, block groups, project
+points) line up with them.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# Grid of the synthetic counties in EPSG:4326 (each county is a CELL x CELL degree square)
+ORIGIN = (-125.0, 50.0)
+CELL = 0.25
+
+RACE_LABELS = [
+    " !!Total:",
+    " !!Total:!!Hispanic or Latino",
+    " !!Total:!!Not Hispanic or Latino:",
+    " !!Total:!!Not Hispanic or Latino:!!Population of one race:",
+    " !!Total:!!Not Hispanic or Latino:!!Population of one race:!!White alone",
+    " !!Total:!!Not Hispanic or Latino:!!Population of one race:!!Black or African American alone",
+    " !!Total:!!Not Hispanic or Latino:!!Population of one race:!!American Indian and Alaska Native alone",
+    " !!Total:!!Not Hispanic or Latino:!!Population of one race:!!Asian alone",
+    " !!Total:!!Not Hispanic or Latino:!!Population of one race:!!Native Hawaiian and Other Pacific Islander alone",
+    " !!Total:!!Not Hispanic or Latino:!!Population of one race:!!Some Other Race alone",
+    " !!Total:!!Not Hispanic or Latino:!!Population of two or more races:!!Population of two races:",
+]
+
+EDUCATION_PREFIX = "Estimate!!Percent!!AGE BY EDUCATIONAL ATTAINMENT!!"
+EDUCATION_LABELS = [
+    "Population 18 to 24 years",
+    "Population 18 to 24 years!!Less than high school graduate",
+    "Population 18 to 24 years!!High school graduate (includes equivalency)",
+    "Population 18 to 24 years!!Some college or associate's degree",
+    "Population 18 to 24 years!!Bachelor's degree or higher",
+    "Population 25 years and over",
+    "Population 25 years and over!!Less than 9th grade",
+    "Population 25 years and over!!9th to 12th grade, no diploma",
+    "Population 25 years and over!!High school graduate (includes equivalency)",
+    "Population 25 years and over!!Some college, no degree",
+    "Population 25 years and over!!Associate's degree",
+    "Population 25 years and over!!Bachelor's degree",
+    "Population 25 years and over!!Graduate or professional degree",
+    "Population 25 years and over!!High school graduate or higher",
+    "Population 25 years and over!!Bachelor's degree or higher",
+]
+
+PARTIES = ["DEMOCRAT", "REPUBLICAN", "GREEN", "LIBERTARIAN", "OTHER"]
+
+
+def counties(n_states, counties_per_state):
+    """
+    The synthetic counties: codes, names, grid cell and area
+    """
+    state_fips = np.repeat(np.arange(1, n_states + 1), counties_per_state)
+    county_fips = np.tile(np.arange(1, counties_per_state + 1) * 2 - 1, n_states)
+    df = pd.DataFrame({
+        "FIPS State": [f"{s:02d}" for s in state_fips],
+        "FIPS County": [f"{c:03d}" for c in county_fips],
+        "State": [f"State {s:02d}" for s in state_fips],
+        "County Name": [f"County {c:03d}" for c in county_fips],
+    })
+    df["GEOID"] = df["FIPS State"] + df["FIPS County"]
+
+    # lay the counties out row by row on a square grid
+    columns = int(np.ceil(np.sqrt(len(df))))
+    df["col"] = np.arange(len(df)) % columns
+    df["row"] = np.arange(len(df)) // columns
+    df["area km2"] = 700.0 + 50.0 * (np.arange(len(df)) % 7)
+    df["area mi2"] = df["area km2"] / 2.59
+    return df
+
+
+def county_bounds(df):
+    """
+    (minx, miny, maxx, maxy) of every county square
+    """
+    minx = ORIGIN[0] + df["col"].to_numpy() * CELL
+    maxy = ORIGIN[1] - df["row"].to_numpy() * CELL
+    return minx, maxy - CELL, minx + CELL, maxy
+
+
+def _write_census(path, labels, values, geography, names):
+    """
+    Write a data.census.gov style table: a row of codes, a row of labels, a trailing empty column
+    """
+    codes = ["GEO_ID", "NAME"] + [f"C{i:03d}" for i in range(len(labels))] + [""]
+    header = ["Geography", "Geographic Area Name"] + list(labels) + [""]
+    body = pd.DataFrame(values, columns=labels)
+    body.insert(0, "Geographic Area Name", names)
+    body.insert(0, "Geography", geography)
+    body[""] = ""
+    with open(path, "w", newline="") as f:
+        pd.DataFrame([codes, header]).to_csv(f, header=False, index=False)
+        body.to_csv(f, header=False, index=False)
+
+
+def project_points(df, n_projects, rng):
+    """
+    Random project locations inside random counties: (county positions, x, y)
+    """
+    which = rng.integers(0, len(df), n_projects)
+    minx, miny, _, _ = county_bounds(df)
+    x = minx[which] + rng.uniform(0.01, CELL - 0.01, n_projects)
+    y = miny[which] + rng.uniform(0.01, CELL - 0.01, n_projects)
+    return which, x, y
+
+
+def write_county_data(root, n_states=10, counties_per_state=50, n_projects=5000, seed=0):
+    """
+    Write every raw county file the cleaners read under root (laid out like RAW_DATA_DIRECTORY)
+
+    root: folder to write in
+    n_states, counties_per_state: number of synthetic counties (n_states <= 99, counties_per_state <= 499)
+    n_projects: number of solar projects (there are a tenth as many wind projects and rooftop rows)
+    """
+    import geopandas as gpd
+
+    rng = np.random.default_rng(seed)
+    df = counties(n_states, counties_per_state)
+    n = len(df)
+    geography = "0500000US" + df["GEOID"]
+    area_names = df["County Name"] + " County, " + df["State"]
+    for folder in ["extras", "county_clean", "county_raw/social factors", "county_raw/electric price", "projects/solar", "projects/wind"]:
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+
+    df[["State", "County Name", "FIPS State", "FIPS County"]].to_csv(f"{root}/extras/US_FIPS_Codes.csv", index=False)
+    df[["GEOID", "State", "County Name", "area km2", "area mi2", "FIPS State", "FIPS County"]].to_csv(
+        f"{root}/county_clean/county_bounding_boxes_full.csv", index=False
+    )
+
+    # projects
+    which, x, y = project_points(df, n_projects, rng)
+    pd.DataFrame({
+        "plant_code": np.arange(n_projects),
+        "county": df["County Name"].to_numpy()[which],
+        "statename": df["State"].to_numpy()[which],
+        "solar_mw": np.round(rng.lognormal(1.5, 1.2, n_projects), 1),
+        "WKT": [f"POINT Z ({a:.5f} {b:.5f} 0)" for a, b in zip(x, y)],
+    }).to_csv(f"{root}/projects/solar/solar_raw.csv", index=False)
+
+    n_wind = max(n_projects // 10, 1)
+    which, x, y = project_points(df, n_wind, rng)
+    gpd.GeoDataFrame({
+        "plant_code": np.arange(n_wind),
+        "county": df["County Name"].to_numpy()[which],
+        "statename": df["State"].to_numpy()[which],
+        "wind_mw": np.round(rng.uniform(1, 300, n_wind), 1),
+    }, geometry=gpd.points_from_xy(x, y), crs="EPSG:4326").to_crs("EPSG:3857").to_file(
+        f"{root}/projects/wind/ez_gis.plant_power_eia_v8_wind.shp"
+    )
+
+    roof = df.sample(n=min(max(n_projects // 10, 1), n), random_state=seed)
+    pd.DataFrame({
+        "region_name": roof["County Name"] + " County",
+        "state_name": roof["State"],
+        "existing_installs_count": rng.integers(0, 5000, len(roof)),
+        "kw_total": rng.uniform(0, 1e5, len(roof)),
+        "kw_median": rng.uniform(1, 20, len(roof)),
+    }).to_csv(f"{root}/projects/solar/solar_roof_raw.csv", index=False)
+
+    # social factors
+    gdp = pd.DataFrame({"GeoFIPS": ' "' + df["GEOID"] + '"', "GeoName": area_names})
+    gdp["Description"] = "Real GDP (thousands of chained 2017 dollars) "
+    for year in range(2017, 2023):
+        gdp[str(year)] = rng.integers(10**5, 10**8, n)
+    gdp.to_csv(f"{root}/county_raw/social factors/gdp_raw.csv", index=False)
+
+    pd.DataFrame({
+        "STATE": df["FIPS State"], "COUNTY": df["FIPS County"], "POPESTIMATE2022": rng.integers(1000, 10**6, n)
+    }).to_csv(f"{root}/county_raw/social factors/population_raw.csv", index=False)
+
+    votes = pd.DataFrame({
+        "county_fips": np.repeat(df["GEOID"].astype(int).astype(float).to_numpy(), len(PARTIES)),
+        "party": np.tile(PARTIES, n),
+        "candidatevotes": rng.integers(0, 50000, n * len(PARTIES)),
+    })
+    votes["totalvotes"] = votes.groupby("county_fips")["candidatevotes"].transform("sum")
+    votes.to_csv(f"{root}/county_raw/social factors/election_raw.csv", index=False)
+
+    race = rng.integers(0, 10000, (n, len(RACE_LABELS)))
+    race[:, 0] = race[:, 1:].sum(axis=1) + 1
+    _write_census(f"{root}/county_raw/social factors/race_dec_raw.csv", RACE_LABELS, race, geography, area_names)
+
+    _write_census(
+        f"{root}/county_raw/social factors/education_raw.csv",
+        [EDUCATION_PREFIX + label for label in EDUCATION_LABELS],
+        np.round(rng.uniform(0, 100, (n, len(EDUCATION_LABELS))), 1), geography, area_names,
+    )
+    _write_census(
+        f"{root}/county_raw/social factors/income_raw.csv", ["Estimate!!Households!!Median income (dollars)"],
+        rng.integers(20000, 150000, (n, 1)), geography, area_names,
+    )
+    _write_census(
+        f"{root}/county_raw/social factors/unemployment_raw.csv",
+        ["Estimate!!Total!!Population 16 years and over", "Estimate!!Unemployment rate!!Population 16 years and over"],
+        np.column_stack([rng.integers(1000, 10**6, n), np.round(rng.uniform(0, 15, n), 1)]), geography, area_names,
+    )
+
+    schools = df.sample(n=n * 3, replace=True, random_state=seed)
+    pd.DataFrame({
+        "NAME": [f"School {i}" for i in range(len(schools))], "STFIP": schools["FIPS State"].to_numpy(),
+        "CNTY": schools["GEOID"].to_numpy(),
+    }).to_csv(f"{root}/county_raw/social factors/private_school_raw.csv", index=False)
+
+    # electric prices
+    pd.DataFrame({
+        "State": df["State"], "County Name": df["County Name"],
+        "comm_rate": rng.uniform(0.05, 0.3, n), "ind_rate": rng.uniform(0.05, 0.3, n), "res_rate": rng.uniform(0.05, 0.3, n),
+    }).to_csv(f"{root}/county_raw/electric price/NREL_raw.csv", index=False)
+    pd.DataFrame({"utility_id_eia": np.arange(n) % 500, "county_id_fips": df["GEOID"]}).to_csv(
+        f"{root}/county_raw/electric price/EIA_raw.csv", index=False
+    )
+    utilities = np.repeat(np.arange(min(n, 500)), 2)
+    pd.DataFrame({
+        "utility_id_eia": utilities, "customer_class": np.tile(["commercial", "residential"], len(utilities) // 2),
+        "customers": rng.integers(10, 10**5, len(utilities)), "sales_mwh": rng.uniform(1e2, 1e6, len(utilities)),
+        "sales_revenue": rng.uniform(1e4, 1e8, len(utilities)),
+    }).to_csv(f"{root}/county_raw/electric price/electric_raw(don't rememeber source).csv", index=False)
+    return df
+
+
+def county_polygons(df):
+    """
+    GeoDataFrame of the county squares with the State, County Name and GEOID columns
+    """
+    import geopandas as gpd
+    import shapely
+
+    return gpd.GeoDataFrame(
+        df[["State", "County Name", "GEOID"]].copy(), geometry=shapely.box(*county_bounds(df)), crs="EPSG:4326"
+    )
+
+
+def block_groups(df, per_side=2):
+    """
+    GeoDataFrame of block groups splitting every county square into per_side x per_side squares
+    """
+    import geopandas as gpd
+    import shapely
+
+    minx, miny, _, _ = county_bounds(df)
+    step = CELL / per_side
+    i, j = np.meshgrid(np.arange(per_side), np.arange(per_side), indexing="ij")
+    i, j = i.ravel(), j.ravel()
+    bg_minx = (minx[:, None] + i * step).ravel()
+    bg_miny = (miny[:, None] + j * step).ravel()
+    # up to 9 block groups per tract
+    tract = (np.arange(len(df))[:, None] % 10000 * 100 + np.arange(len(i)) // 9).ravel()
+    number = np.tile(np.arange(len(i)) % 9 + 1, len(df))
+    bg = pd.DataFrame({
+        "STATEFP": np.repeat(df["FIPS State"].to_numpy(), len(i)),
+        "COUNTYFP": np.repeat(df["FIPS County"].to_numpy(), len(i)),
+        "TRACTCE": [f"{t:06d}" for t in tract],
+        "BLKGRPCE": number.astype(str),
+    })
+    bg["GEOID"] = bg["STATEFP"] + bg["COUNTYFP"] + bg["TRACTCE"] + bg["BLKGRPCE"]
+    return gpd.GeoDataFrame(bg, geometry=shapely.box(bg_minx, bg_miny, bg_minx + step, bg_miny + step), crs="EPSG:4326")
+
+
+def write_rasters(root, df, pixels_per_county=16, n_layers=7, seed=0):
+    """
+    Write n_layers float32 GeoTIFFs covering the county grid (values 0-110, nodata -9999)
+
+    Returns the paths of the rasters.
+    """
+    import rasterio
+    from rasterio.transform import from_origin
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(root, exist_ok=True)
+    width = int(df["col"].max() + 1) * pixels_per_county
+    height = int(df["row"].max() + 1) * pixels_per_county
+    transform = from_origin(ORIGIN[0], ORIGIN[1], CELL / pixels_per_county, CELL / pixels_per_county)
+
+    paths = []
+    for layer in range(n_layers):
+        array = rng.uniform(0, 110, (height, width)).astype("float32")
+        array[rng.random((height, width)) < 0.05] = -9999
+        path = os.path.join(root, f"layer_{layer}.tif")
+        with rasterio.open(
+            path, "w", driver="GTiff", height=height, width=width, count=1, dtype="float32",
+            crs="EPSG:4326", transform=transform, nodata=-9999, tiled=True,
+        ) as dst:
+            dst.write(array, 1)
+        paths.append(path)
+    return paths
@@ -0,0 +1,282 @@
+"""
+Benchmarks of the county cleaners, the zonal statistics and the block group assignment
+
+Synthetic inputs (benchmarks/fixtures.py) are generated at the requested scale, every benchmark is
+timed over a few repeats and run once more under tracemalloc for its peak memory. Results are
+written as JSON so runs can be compared over time.
+
+    python run.py --scale small --out results/small.json
+    python run.py --scale medium --compare results/small.json
+    python run.py --only get_solar --check-import-budget
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.join(HERE, "..", "County Level"), os.path.join(HERE, "..", "techno_econ_suitability")]
+
+import fixtures
+
+# n_states, counties_per_state, n_projects, block groups per county side, raster pixels per county side, project points
+SCALES = {
+    "small": dict(n_states=5, counties_per_state=40, n_projects=2_000, bg_per_side=2, pixels_per_county=16, n_points=5_000),
+    "medium": dict(n_states=50, counties_per_state=60, n_projects=50_000, bg_per_side=4, pixels_per_county=32, n_points=100_000),
+    "large": dict(n_states=56, counties_per_state=400, n_projects=500_000, bg_per_side=8, pixels_per_county=64, n_points=1_000_000),
+}
+
+
+# Seconds importing the county package may take on top of pandas, in a fresh process
+IMPORT_BUDGET_S = 0.1
+# Modules importing the county package must not pull in (they are imported by the functions needing them)
+HEAVY_MODULES = ["geopandas", "shapely", "pyogrio", "fiona", "rasterio", "rasterstats"]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+import pandas
+start = time.perf_counter()
+import src.main, src.features, src.pipeline, src.block_group
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "heavy_modules": [m for m in %r if m in sys.modules]}))
+"""
+
+
+#### Benchmarks #####
+def import_benchmark(repeat):
+    """
+    Time importing the county package in fresh processes and check it against the import budget
+    """
+    runs = []
+    for _ in range(max(repeat, 1)):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT % (HEAVY_MODULES,)], cwd=os.path.join(HERE, "..", "County Level"),
+            capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(output))
+    seconds = [run["seconds"] for run in runs]
+    heavy = sorted({module for run in runs for module in run["heavy_modules"]})
+    return {
+        "times": seconds, "min": min(seconds), "median": statistics.median(seconds), "budget_s": IMPORT_BUDGET_S,
+        "heavy_modules": heavy, "within_budget": min(seconds) <= IMPORT_BUDGET_S and not heavy,
+    }
+
+
+
+def county_benchmarks(data_root):
+    """
+    {name: function} of the county cleaner benchmarks, reading the fixtures under data_root
+    """
+    # the data folder has to be set before the cleaners first read the reference tables
+    import src.CONSTANTS
+    src.CONSTANTS.RAW_DATA_DIRECTORY = data_root
+    from src.CONSTANTS import get_file_path
+    from src.main import load_data
+    from src.sources import clear_source_cache
+    from src.utils import (
+        bounding_box_getter, get_election, get_GDP, get_race_dec, get_solar, get_solar_buckets, get_wind,
+        merged_normalized_data,
+    )
+
+    bounding_box = bounding_box_getter()
+
+    def cold(function):
+        # every repeat reads its files again
+        def run():
+            clear_source_cache()
+            return function()
+        return run
+
+    def merged():
+        wind = get_wind(get_file_path("Wind"), bounding_box)
+        gdp = get_GDP(get_file_path("GDP"), bounding_box, get_file_path("population_data"))
+        solar = get_solar_buckets(get_file_path("Solar"), bounding_box)
+        return merged_normalized_data(wind, gdp, solar, bounding_box)
+
+    return {
+        "get_solar": cold(lambda: get_solar(get_file_path("Solar"), bounding_box)),
+        "get_election": cold(lambda: get_election(get_file_path("election"), party="all")),
+        "get_race_dec": cold(lambda: get_race_dec(get_file_path("DEC_race"))),
+        "load_data": cold(load_data),
+        "load_data_all": cold(lambda: load_data(election_type="all", education_type="all")),
+        "merged_normalized_data": cold(merged),
+    }
+
+
+def raster_benchmarks(tifs, zones, pyramid_dir, raster_cache_dir):
+    """
+    {name: function} of the zonal statistics benchmarks over the rasters and the zone polygons
+
+    The pyramids and the raster cache are built up front, their runs only time the reductions.
+    """
+    from utils import build_pyramids, cache_rasters, calculate_zonal_stats, process_tif_files
+
+    build_pyramids(tifs, pyramid_dir, nodata_value=-9999)
+    cache_rasters(tifs, raster_cache_dir, nodata_value=-9999)
+    return {
+        "calculate_zonal_stats": lambda: calculate_zonal_stats(tifs[0], zones, -9999),
+        "process_tif_files": lambda: process_tif_files(tifs, zones, nodata_value=-9999),
+        "process_tif_files_zone_index": lambda: process_tif_files(tifs, zones, nodata_value=-9999, zone_index=True),
+        "process_tif_files_zone_index_cached": lambda: process_tif_files(
+            tifs, zones, nodata_value=-9999, zone_index=True, raster_cache_dir=raster_cache_dir
+        ),
+        "process_tif_files_auto": lambda: process_tif_files(
+            tifs, zones, nodata_value=-9999, resolution="auto", pyramid_dir=pyramid_dir
+        ),
+    }
+
+
+def point_benchmarks(points, block_groups):
+    """
+    {name: function} of the point to block group assignment benchmarks
+    """
+    from src.geo import assign_points_to_block_groups
+
+    return {
+        "assign_points_to_block_groups": lambda: assign_points_to_block_groups(points, block_groups),
+        "assign_points_to_block_groups_wkt": lambda: assign_points_to_block_groups(points.to_wkt(), block_groups),
+    }
+
+
+#### Runner #####
+def measure(function, repeat):
+    """
+    Wall times of repeat runs, then the peak traced memory of one more run
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"times": times, "min": min(times), "median": statistics.median(times), "peak_bytes": peak}
+
+
+def environment(scale):
+    import geopandas
+    import numpy
+    import pandas
+    import rasterio
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "packages": {
+            module.__name__: module.__version__ for module in [numpy, pandas, geopandas, rasterio]
+        },
+        "scale": scale,
+    }
+
+
+def run(scale, repeat=3, only=None, workdir=None, seed=0):
+    """
+    Generate the fixtures of a scale and run every benchmark (or only the names in only)
+
+    Returns the results as a JSON-ready dict.
+    """
+    import geopandas as gpd
+    import numpy as np
+
+    workdir = workdir or tempfile.mkdtemp(prefix="benchmarks_")
+    data_root = os.path.join(workdir, "data")
+    counties = fixtures.write_county_data(
+        data_root, scale["n_states"], scale["counties_per_state"], scale["n_projects"], seed=seed
+    )
+    zones = fixtures.county_polygons(counties)
+    tifs = fixtures.write_rasters(os.path.join(workdir, "rasters"), counties, scale["pixels_per_county"], seed=seed)
+    block_groups = fixtures.block_groups(counties, scale["bg_per_side"])
+    _, x, y = fixtures.project_points(counties, scale["n_points"], np.random.default_rng(seed))
+    points = gpd.GeoSeries(gpd.points_from_xy(x, y), crs="EPSG:4326")
+
+    benchmarks = {
+        **county_benchmarks(data_root),
+        **raster_benchmarks(tifs, zones, os.path.join(workdir, "pyramids"), os.path.join(workdir, "raster_cache")),
+        **point_benchmarks(points, block_groups),
+    }
+    results = {"meta": environment(scale), "import": import_benchmark(repeat), "benchmarks": {}}
+    status = "within" if results["import"]["within_budget"] else "OVER"
+    print(
+        f"{'import':<36} min    {results['import']['min']:9.4f} s  {status} the {IMPORT_BUDGET_S} s budget"
+        + (f", imports {results['import']['heavy_modules']}" if results["import"]["heavy_modules"] else "")
+    )
+    for name, function in benchmarks.items():
+        if only and name not in only:
+            continue
+        result = measure(function, repeat)
+        results["benchmarks"][name] = result
+        print(f"{name:<36} median {result['median']:9.4f} s  peak {result['peak_bytes'] / 2**20:9.1f} MiB")
+    return results
+
+
+def compare(new, old):
+    """
+    Print the median time and peak memory ratios (new / old) of the benchmarks in both runs
+    """
+    if new["meta"]["scale"] != old["meta"]["scale"]:
+        print("warning: the runs were made at different scales")
+    print(f"{'benchmark':<36} {'time':>8} {'memory':>8}")
+    if "import" in new and "import" in old:
+        print(f"{'import':<36} {new['import']['min'] / old['import']['min']:7.2f}x")
+    for name, result in new["benchmarks"].items():
+        if name not in old["benchmarks"]:
+            continue
+        before = old["benchmarks"][name]
+        time_ratio = result["median"] / before["median"]
+        memory_ratio = result["peak_bytes"] / before["peak_bytes"] if before["peak_bytes"] else float("nan")
+        print(f"{name:<36} {time_ratio:7.2f}x {memory_ratio:7.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    for key in SCALES["small"]:
+        parser.add_argument(f"--{key.replace('_', '-')}", type=int, dest=key, help="overrides the scale preset")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", help="names of the benchmarks to run")
+    parser.add_argument("--workdir", help="folder the fixtures are written in (a temporary folder by default)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="JSON file the results are written to")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument(
+        "--check-import-budget", action="store_true", help="exit with an error when importing the package is over budget"
+    )
+    args = parser.parse_args(argv)
+
+    scale = dict(SCALES[args.scale], name=args.scale)
+    scale.update({key: getattr(args, key) for key in SCALES["small"] if getattr(args, key) is not None})
+
+    results = run(scale, args.repeat, args.only, args.workdir, args.seed)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    if args.check_import_budget and not results["import"]["within_budget"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
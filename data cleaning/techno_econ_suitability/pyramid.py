@@ -0,0 +1,186 @@
+"""
+Overview pyramids of the suitability rasters holding masked sums and counts
+
+Level k of a raster has one pixel per 2**k x 2**k block of native pixels. It stores the sum of the
+valid values of the block and how many valid pixels there are, so the mean over any set of blocks,
+sum(sums) / sum(counts), is the exact mean of the native pixels they cover. Each level is a pair of
+.npy files loaded memory-mapped, pyramid.json next to them records the grid of every level and the
+raster it was built from.
+"""
+import json
+import math
+import os
+from collections import namedtuple
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.windows import Window
+
+# Native rows read at once while building a pyramid (rounded up to a multiple of the coarsest block)
+STRIP_ROWS = 2048
+# Levels are added while the short side of the coarsest one keeps at least this many pixels
+MIN_LEVEL_SIZE = 8
+
+# level: 1 for 2x2 blocks, 2 for 4x4 blocks...; transform and shape: grid of the level;
+# sums (float64) and counts (int32): masked sums and valid pixel counts of the blocks
+Level = namedtuple("Level", ["level", "transform", "shape", "sums", "counts"])
+
+
+def valid_pixels(values, nodata_value):
+    """
+    Mask of the pixels used in the means: not NaN, not nodata_value and not above 101
+    """
+    # NaNs compare False
+    valid = values <= 101
+    if not np.isnan(nodata_value):
+        valid &= values != nodata_value
+    return valid
+
+
+def block_sums(array, factor):
+    """
+    Sum of every factor x factor block of a 2D array, partial blocks at the bottom and right edges included
+    """
+    height, width = array.shape
+    out_height, out_width = math.ceil(height / factor), math.ceil(width / factor)
+    if (height, width) != (out_height * factor, out_width * factor):
+        padded = np.zeros((out_height * factor, out_width * factor), dtype=array.dtype)
+        padded[:height, :width] = array
+        array = padded
+    return array.reshape(out_height, factor, out_width, factor).sum(axis=(1, 3), dtype=array.dtype)
+
+
+def pyramid_levels(shape, max_levels=None):
+    """
+    Number of levels of the pyramid of a raster of the given (height, width)
+    """
+    n_levels = max(int(math.log2(min(shape) / MIN_LEVEL_SIZE)), 0) if min(shape) >= MIN_LEVEL_SIZE else 0
+    return n_levels if max_levels is None else min(n_levels, max_levels)
+
+
+def level_grid(transform, shape, level):
+    """
+    Transform and (height, width) of a pyramid level of the native grid
+    """
+    factor = 2 ** level
+    return transform * Affine.scale(factor), (math.ceil(shape[0] / factor), math.ceil(shape[1] / factor))
+
+
+def pyramid_folder(tif_path, pyramid_dir):
+    return os.path.join(pyramid_dir, os.path.splitext(os.path.basename(tif_path))[0])
+
+
+def _source(tif_path):
+    stat = os.stat(tif_path)
+    return {"path": os.path.abspath(tif_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _same_nodata(a, b):
+    return (np.isnan(a) and np.isnan(b)) or a == b
+
+
+def build_pyramid(tif_path, folder, nodata_value, max_levels=None, strip_rows=STRIP_ROWS):
+    """
+    Write the pyramid of the first band of a raster to folder
+
+    nodata_value: value left out of the sums and counts, along with NaNs and values above 101
+    max_levels: cap on the number of levels (they stop at MIN_LEVEL_SIZE pixels otherwise)
+    strip_rows: native rows read at once, peak memory is set by this many rows instead of the full raster
+
+    Returns the number of levels written.
+    """
+    os.makedirs(folder, exist_ok=True)
+    with rasterio.open(tif_path) as src:
+        height, width = src.shape
+        n_levels = pyramid_levels(src.shape, max_levels)
+        block = 2 ** n_levels
+        strip_rows = max(math.ceil(strip_rows / block), 1) * block
+
+        # levels are written under temporary names first so concurrent runs never read a partial pyramid
+        paths, outputs = [], []
+        for level in range(1, n_levels + 1):
+            _, shape = level_grid(src.transform, src.shape, level)
+            level_paths = [os.path.join(folder, f"level_{level}_{name}.npy") for name in ["sums", "counts"]]
+            temp_paths = [f"{path}.{os.getpid()}.tmp.npy" for path in level_paths]
+            paths += list(zip(temp_paths, level_paths))
+            outputs.append([
+                np.lib.format.open_memmap(temp_paths[0], mode="w+", dtype="float64", shape=shape),
+                np.lib.format.open_memmap(temp_paths[1], mode="w+", dtype="int32", shape=shape),
+            ])
+
+        for row_start in range(0, height if n_levels else 0, strip_rows):
+            values = src.read(1, window=Window(0, row_start, width, min(strip_rows, height - row_start)))
+            valid = valid_pixels(values, nodata_value)
+            sums = np.where(valid, values, 0).astype("float64")
+            counts = valid.astype("int32")
+            # every level is summed from the one below it
+            for level, (level_sums, level_counts) in enumerate(outputs, 1):
+                sums, counts = block_sums(sums, 2), block_sums(counts, 2)
+                start = row_start // 2 ** level
+                level_sums[start:start + len(sums)] = sums
+                level_counts[start:start + len(counts)] = counts
+
+        meta = {
+            "source": _source(tif_path),
+            "nodata_value": float(nodata_value),
+            "crs": src.crs.to_wkt() if src.crs else None,
+            "transform": list(src.transform)[:6],
+            "shape": [height, width],
+            "levels": n_levels,
+        }
+
+    for level_sums, level_counts in outputs:
+        level_sums.flush()
+        level_counts.flush()
+    del outputs
+    for temp_path, path in paths:
+        os.replace(temp_path, path)
+    # the sidecar is written last, a folder without it is not a pyramid yet
+    meta_path = os.path.join(folder, "pyramid.json")
+    with open(f"{meta_path}.{os.getpid()}.tmp", "w") as f:
+        json.dump(meta, f, indent=1)
+    os.replace(f"{meta_path}.{os.getpid()}.tmp", meta_path)
+    return n_levels
+
+
+def load_pyramid(tif_path, folder, nodata_value):
+    """
+    Levels of the pyramid in folder (memory-mapped), or None when it is missing or was built from
+    another version of the raster or with another nodata value
+    """
+    meta_path = os.path.join(folder, "pyramid.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    source = _source(tif_path)
+    if [meta["source"][key] for key in ["size", "mtime"]] != [source["size"], source["mtime"]]:
+        return None
+    if not _same_nodata(meta["nodata_value"], float(nodata_value)):
+        return None
+
+    transform, shape = Affine(*meta["transform"]), tuple(meta["shape"])
+    levels = []
+    for level in range(1, meta["levels"] + 1):
+        level_transform, level_shape = level_grid(transform, shape, level)
+        levels.append(Level(
+            level, level_transform, level_shape,
+            np.load(os.path.join(folder, f"level_{level}_sums.npy"), mmap_mode="r"),
+            np.load(os.path.join(folder, f"level_{level}_counts.npy"), mmap_mode="r"),
+        ))
+    return levels
+
+
+def cached_pyramid(tif_path, pyramid_dir, nodata_value, max_levels=None):
+    """
+    Levels of the pyramid of a raster, built in pyramid_dir/<raster name> the first time (or when the raster changed)
+
+    Returns a list of Level, coarser levels last (level 0, the native grid, is the raster itself).
+    """
+    folder = pyramid_folder(tif_path, pyramid_dir)
+    levels = load_pyramid(tif_path, folder, nodata_value)
+    if levels is None:
+        build_pyramid(tif_path, folder, nodata_value, max_levels)
+        levels = load_pyramid(tif_path, folder, nodata_value)
+    return levels
@@ -0,0 +1,142 @@
+"""
+Local cache of the decoded suitability rasters
+
+Each layer is decoded once into a little-endian .npy holding the first band with the masking of the
+zonal statistics already applied (NaNs and values above 101 replaced with the nodata value), next to
+a .json sidecar with its transform and CRS. The project sampling reads the raw band instead (masked=False),
+which is cached as it is stored in the raster, so the cache never changes what it averages. Readers load it with np.load(mmap_mode="r"), so repeated
+runs and worker processes share the page cache instead of each holding a decompressed copy.
+"""
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.windows import Window
+
+# Rows decoded at once while filling the cache
+STRIP_ROWS = 2048
+
+# array: the masked band (the raw band when masked=False, memory-mapped when cached), transform and crs: its grid, nodata_value: the value masked pixels hold
+Layer = namedtuple("Layer", ["array", "transform", "crs", "nodata_value"])
+
+
+def cache_dtype(dtype, nodata_value):
+    """
+    Little-endian dtype of a masked band: the raster dtype when nodata_value fits in it, float64 otherwise
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind in "iu":
+        info = np.iinfo(dtype)
+        if not (float(nodata_value).is_integer() and info.min <= nodata_value <= info.max):
+            # the nodata value (e.g. NaN) does not fit in the integer raster
+            dtype = np.dtype("float64")
+    return dtype.newbyteorder("<")
+
+
+def mask_band(values, nodata_value, dtype):
+    """
+    Cast a band to dtype and replace its NaNs and values above 101 with nodata_value
+    """
+    values = values.astype(dtype, copy=False)
+    if values.dtype.kind == "f":
+        values[np.isnan(values)] = nodata_value
+    values[values > 101] = nodata_value
+    return values
+
+
+def cache_paths(tif_path, cache_dir, nodata_value, masked=True):
+    """
+    (.npy, .json) paths of the cached band of a raster, one pair per nodata value and one for the raw band
+    """
+    stem = os.path.splitext(os.path.basename(tif_path))[0]
+    base = os.path.join(cache_dir, f"{stem}.nodata_{float(nodata_value):g}" if masked else f"{stem}.raw")
+    return f"{base}.npy", f"{base}.json"
+
+
+def _source(tif_path):
+    stat = os.stat(tif_path)
+    return {"path": os.path.abspath(tif_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def build_cache(tif_path, cache_dir, nodata_value, strip_rows=STRIP_ROWS, masked=True):
+    """
+    Decode the first band of a raster into the cache, strip_rows rows at a time
+
+    masked: apply mask_band, the band is stored unchanged otherwise
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    array_path, meta_path = cache_paths(tif_path, cache_dir, nodata_value, masked)
+    # written under temporary names first so concurrent runs never read a partial file
+    temp_path = f"{array_path}.{os.getpid()}.tmp.npy"
+
+    with rasterio.open(tif_path) as src:
+        height, width = src.shape
+        dtype = cache_dtype(src.dtypes[0], nodata_value) if masked else np.dtype(src.dtypes[0]).newbyteorder("<")
+        out = np.lib.format.open_memmap(temp_path, mode="w+", dtype=dtype, shape=(height, width))
+        for row_start in range(0, height, strip_rows):
+            rows = min(strip_rows, height - row_start)
+            values = src.read(1, window=Window(0, row_start, width, rows))
+            out[row_start:row_start + rows] = mask_band(values, nodata_value, dtype) if masked else values
+        meta = {
+            "source": _source(tif_path),
+            "nodata_value": float(nodata_value),
+            "crs": src.crs.to_wkt() if src.crs else None,
+            "transform": list(src.transform)[:6],
+            "shape": [height, width],
+            "dtype": dtype.str,
+        }
+    out.flush()
+    del out
+    os.replace(temp_path, array_path)
+    # the sidecar is written last, an array without it is not in the cache yet
+    with open(f"{meta_path}.{os.getpid()}.tmp", "w") as f:
+        json.dump(meta, f, indent=1)
+    os.replace(f"{meta_path}.{os.getpid()}.tmp", meta_path)
+
+
+def load_cache(tif_path, cache_dir, nodata_value, masked=True):
+    """
+    Cached band of a raster as a Layer (memory-mapped, read only), or None when it is missing or
+    was decoded from another version of the raster
+    """
+    array_path, meta_path = cache_paths(tif_path, cache_dir, nodata_value, masked)
+    if not (os.path.exists(meta_path) and os.path.exists(array_path)):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    source = _source(tif_path)
+    if [meta["source"][key] for key in ["size", "mtime"]] != [source["size"], source["mtime"]]:
+        return None
+    return Layer(
+        np.load(array_path, mmap_mode="r"), Affine(*meta["transform"]),
+        CRS.from_wkt(meta["crs"]) if meta["crs"] else None, nodata_value,
+    )
+
+
+def cached_raster(tif_path, cache_dir, nodata_value, masked=True):
+    """
+    Masked first band of a raster from cache_dir, decoded into it the first time (or when the raster changed)
+
+    masked: False for the band as stored in the raster (nodata_value is then only recorded in the Layer)
+    """
+    layer = load_cache(tif_path, cache_dir, nodata_value, masked)
+    if layer is None:
+        build_cache(tif_path, cache_dir, nodata_value, masked=masked)
+        layer = load_cache(tif_path, cache_dir, nodata_value, masked)
+    return layer
+
+
+def read_layer(tif_path, nodata_value, cache_dir=None):
+    """
+    Masked first band of a raster as a Layer, from the cache in cache_dir or decoded in memory when it is None
+    """
+    if cache_dir is not None:
+        return cached_raster(tif_path, cache_dir, nodata_value)
+    with rasterio.open(tif_path) as src:
+        values = src.read(1)
+        array = mask_band(values, nodata_value, cache_dtype(values.dtype, nodata_value))
+        return Layer(array, src.transform, src.crs, nodata_value)
@@ -0,0 +1,142 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import rasterio
+
+from raster_cache import cached_raster
+from src.profiling import profiled
+from utils import col_names
+
+# Side in pixels of the tiles the points are grouped in, the summed-area tables are only built over
+# one tile (padded by the largest window) at a time so peak memory does not grow with the point spread
+TILE_SIZE = 1024
+
+
+def points_to_pixels(points, transform):
+    """
+    Row and column of the raster pixel under every point, computed for all points at once
+
+    Pixel coordinates are truncated toward zero like int() in the original per-point loop, so points
+    less than a pixel above or left of the raster land on its first row or column.
+    """
+    inverse = ~transform
+    x = points.x.to_numpy()
+    y = points.y.to_numpy()
+    cols = np.trunc(inverse.a * x + inverse.b * y + inverse.c).astype("int64")
+    rows = np.trunc(inverse.d * x + inverse.e * y + inverse.f).astype("int64")
+    return rows, cols
+
+
+def integral_tables(array, nodata_value):
+    """
+    Summed-area tables of the valid values and of the valid pixel count of a raster
+
+    Pixels equal to nodata_value or NaN are not valid. Both tables have an extra leading row and
+    column of zeros so that the sum over array[r0:r1, c0:c1] is
+    table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0].
+    Sums of integer rasters are exact int64, float64 otherwise.
+    """
+    array = np.asarray(array)
+    valid = array != nodata_value
+    if array.dtype.kind == "f":
+        valid &= ~np.isnan(array)
+
+    sum_dtype = "int64" if array.dtype.kind in "iub" else "float64"
+    sums = np.zeros((array.shape[0] + 1, array.shape[1] + 1), dtype=sum_dtype)
+    counts = np.zeros(sums.shape, dtype="int64")
+    np.cumsum(np.where(valid, array, 0), axis=0, dtype=sum_dtype, out=sums[1:, 1:])
+    np.cumsum(sums[1:, 1:], axis=1, out=sums[1:, 1:])
+    np.cumsum(valid, axis=0, out=counts[1:, 1:])
+    np.cumsum(counts[1:, 1:], axis=1, out=counts[1:, 1:])
+    return sums, counts
+
+
+def point_tiles(rows, cols, tile_size=TILE_SIZE):
+    """
+    Positions of the points grouped by the tile_size x tile_size tile of the raster their pixel is in
+    """
+    keys = (rows // tile_size) * (cols.max() // tile_size + 1) + cols // tile_size
+    order = np.argsort(keys, kind="stable")
+    return np.split(order, np.flatnonzero(np.diff(keys[order])) + 1)
+
+
+def window_means(tables, rows, cols, window_size):
+    """
+    Mean of the valid pixels in the (2 * window_size + 1) square window around every pixel
+
+    tables: (sums, counts) from integral_tables
+    rows, cols: pixel of every point (in the grid the tables were built on)
+    window_size: half the size of the square window (e.g. 3 means a 7x7 window)
+
+    Windows are clipped at the raster edges. Points outside the raster or whose window has no
+    valid pixel get NaN.
+    """
+    sums, counts = tables
+    height, width = sums.shape[0] - 1, sums.shape[1] - 1
+    inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+
+    r0 = np.clip(rows - window_size, 0, height)
+    r1 = np.clip(rows + window_size + 1, 0, height)
+    c0 = np.clip(cols - window_size, 0, width)
+    c1 = np.clip(cols + window_size + 1, 0, width)
+
+    window_sum = sums[r1, c1] - sums[r0, c1] - sums[r1, c0] + sums[r0, c0]
+    window_count = counts[r1, c1] - counts[r0, c1] - counts[r1, c0] + counts[r0, c0]
+
+    means = np.full(len(rows), np.nan)
+    ok = inside & (window_count > 0)
+    means[ok] = window_sum[ok] / window_count[ok]
+    return means
+
+
+@profiled(rows_in=lambda tif_filepaths, points, *args, **kwargs: len(points))
+def sample_layers(tif_filepaths, points, window_size=50, nodata_value=255, raster_cache_dir=None):
+    """
+    Windowed mean of every raster around every project point
+
+    tif_filepaths: paths to the rasters (one column per entry of col_names)
+    points: GeoSeries / GeoDataFrame of points, or a Series of WKT strings in EPSG:4326
+    window_size: half the size of the square window, or a list of them to sweep several sizes
+    nodata_value: value ignored in the means
+    raster_cache_dir: folder of the decoded rasters (see raster_cache.py), the windows are then sliced from
+        the memory-mapped raw bands, the means are the same as without it
+
+    Returns a dataframe aligned with the points with one column per layer, named
+    "<layer>_<window_size>" when several window sizes are given.
+    """
+    if isinstance(points, gpd.GeoDataFrame):
+        points = points.geometry
+    elif not isinstance(points, gpd.GeoSeries):
+        points = gpd.GeoSeries.from_wkt(points, crs="EPSG:4326")
+
+    window_sizes = list(window_size) if np.ndim(window_size) else [window_size]
+    largest = max(window_sizes)
+    results = pd.DataFrame(index=points.index)
+
+    for tif_path, col_name in zip(tif_filepaths, col_names):
+        # points outside the raster keep NaN
+        means = {size: np.full(len(points), np.nan) for size in window_sizes}
+        with rasterio.open(tif_path) as src:
+            layer_points = points.to_crs(src.crs) if points.crs != src.crs else points
+            rows, cols = points_to_pixels(layer_points, src.transform)
+            inside = np.flatnonzero((rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width))
+            band = None if raster_cache_dir is None else cached_raster(tif_path, raster_cache_dir, nodata_value, masked=False).array
+
+            # only the windows around the points of one tile are read and tabulated at a time
+            for tile in point_tiles(rows[inside], cols[inside]) if len(inside) else []:
+                positions = inside[tile]
+                tile_rows, tile_cols = rows[positions], cols[positions]
+                row_start = max(tile_rows.min() - largest, 0)
+                row_stop = min(tile_rows.max() + largest + 1, src.height)
+                col_start = max(tile_cols.min() - largest, 0)
+                col_stop = min(tile_cols.max() + largest + 1, src.width)
+                window = rasterio.windows.Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+                tile_band = src.read(1, window=window) if band is None else band[window.toslices()]
+                tables = integral_tables(tile_band, nodata_value)
+                for size in window_sizes:
+                    means[size][positions] = window_means(tables, tile_rows - row_start, tile_cols - col_start, size)
+
+        for size in window_sizes:
+            results[col_name if len(window_sizes) == 1 else f"{col_name}_{size}"] = means[size]
+
+    return results
@@ -1,48 +1,197 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
 import pandas as pd
 import rasterio
 import numpy as np
 from rasterstats import zonal_stats
 
+from pyramid import cached_pyramid
+from raster_cache import cache_dtype, cached_raster, mask_band, read_layer
+from zonal import geometry_window, process_layers
+
+# the stage instrumentation is shared with the county cleaning code, the County Level folder has to be on sys.path
+from src.profiling import profiled, progress
+
+logger = logging.getLogger("cleaning.zonal")
+
 col_names = ["GHI", "Protected_Land", "Habitat", "Slope", "Population_Density", "Distance_to_Substation", "Land_Cover"]
 
-def calculate_zonal_stats(tif_path, geodataframe, nodata_value ):
+def mask_array(array, nodata_value):
+    """
+    Replace NaNs and values above 101 with nodata_value, in place when the dtype allows it
+    """
+    return mask_band(array, nodata_value, cache_dtype(array.dtype, nodata_value))
+
+
+def iter_windowed_zonal_stats(tif_path, geodataframe, nodata_value, raster_cache_dir=None):
+    """
+    Yield the mean raster value of every polygon, reading only the window under its bounds
+
+    Peak memory is set by the largest polygon window instead of the full raster.
+    raster_cache_dir: windows are sliced from the memory-mapped band cached there (see raster_cache.py)
+    """
+    layer = None if raster_cache_dir is None else cached_raster(tif_path, raster_cache_dir, nodata_value)
     with rasterio.open(tif_path) as src:
-        affine = src.transform
-        array = src.read(1)  # Read the first band
-        array = np.where(np.isnan(array), nodata_value, array)  # Replace NaNs with nodata_value
-        # Debugging: Check raster data and affine transformation
-        print(f"Raster data shape: {array.shape}")
-        print(f"Affine transformation: {affine}")
-        # Check the CRS of the raster
-        raster_crs = src.crs
-        print(f"Raster CRS: {raster_crs}")
-        if geodataframe.crs != raster_crs:
-            geodataframe = geodataframe.to_crs(raster_crs)
-            
-        # filter out values that are less than 100
-        array = np.where(array > 101, nodata_value, array)
+        if geodataframe.crs != src.crs:
+            geodataframe = geodataframe.to_crs(src.crs)
+
+        for geometry in geodataframe.geometry:
+            window = None if geometry is None or geometry.is_empty else geometry_window(
+                geometry, src.transform, src.width, src.height
+            )
+            if window is None:
+                yield None
+                continue
+
+            if layer is None:
+                array = mask_array(src.read(1, window=window), nodata_value)
+            else:
+                array = np.asarray(layer.array[window.toslices()])
+            stats = zonal_stats(
+                [geometry], array, affine=src.window_transform(window), stats="mean",
+                nodata=nodata_value, all_touched=True
+            )
+            yield stats[0]["mean"]
+
+
+@profiled(rows_in=lambda tif_path, geodataframe, *args, **kwargs: len(geodataframe))
+def calculate_zonal_stats(tif_path, geodataframe, nodata_value, windowed=False, raster_cache_dir=None):
+    if windowed:
+        return list(iter_windowed_zonal_stats(tif_path, geodataframe, nodata_value, raster_cache_dir))
+
+    # the first band with NaNs and values above 101 replaced with nodata_value, memory-mapped from the cache when there is one
+    layer = read_layer(tif_path, nodata_value, raster_cache_dir)
+    logger.debug("%s: shape %s, transform %s, CRS %s", tif_path, layer.array.shape, tuple(layer.transform), layer.crs)
+    if geodataframe.crs != layer.crs:
+        geodataframe = geodataframe.to_crs(layer.crs)
 
     # Calculate zonal statistics
-    stats = zonal_stats(geodataframe, array, affine=affine, stats="mean", nodata=nodata_value, all_touched=True)
-    print(stats)
+    stats = zonal_stats(
+        geodataframe, layer.array, affine=layer.transform, stats="mean", nodata=nodata_value, all_touched=True
+    )
+    logger.debug("%s: %d zones, %d without data", tif_path, len(stats), sum(stat["mean"] is None for stat in stats))
     # Extract mean values and add to GeoDataFrame
     mean_values = [stat['mean'] for stat in stats]
     return mean_values
 
-def process_tif_files(tif_filepaths, bounding_box, nodata_value=-9999,bg=False):
-    x = bounding_box.copy()
+@profiled(rows_in=lambda tif_filepaths, *args, **kwargs: len(tif_filepaths))
+def build_pyramids(tif_filepaths, pyramid_dir, nodata_value=-9999):
+    """
+    Build the overview pyramids of the rasters that do not have an up to date one yet
+
+    Run once before the zonal statistics with resolution="auto" or a pyramid level (see pyramid.py);
+    process_tif_files would otherwise build them on first use.
+    """
+    for tif_path in progress(list(tif_filepaths), desc="pyramids"):
+        levels = cached_pyramid(tif_path, pyramid_dir, nodata_value)
+        logger.debug("%s: %d pyramid levels", tif_path, len(levels))
+
 
-    # Initialize results DataFrame
-    results = pd.DataFrame(index=x.index, columns=col_names)
+@profiled(rows_in=lambda tif_filepaths, *args, **kwargs: len(tif_filepaths))
+def cache_rasters(tif_filepaths, raster_cache_dir, nodata_value=-9999):
+    """
+    Decode the rasters that are not in the raster cache yet (see raster_cache.py)
+
+    Later runs and every worker then memory-map the cached bands instead of decompressing the rasters again.
+    """
+    for tif_path in progress(list(tif_filepaths), desc="raster cache"):
+        cached_raster(tif_path, raster_cache_dir, nodata_value)
+
+
+def zonal_means_frame(
+    tif_filepaths, geodataframe, nodata_value, windowed=False, zone_index=False, zone_cache_dir=None, resolution="native",
+    pyramid_dir=None, raster_cache_dir=None
+):
+    """
+    Mean of every raster (one column per entry of col_names) for every polygon of the geodataframe
+
+    resolution, pyramid_dir: see zonal.process_layers, a resolution other than "native" implies zone_index
+    raster_cache_dir: folder of the decoded rasters (see raster_cache.py), the rasters are decoded on every call when None
+    """
+    results = pd.DataFrame(index=geodataframe.index, columns=col_names)
+
+    if zone_index or resolution != "native":
+        # rasterize the polygons once per raster grid and reduce every layer from that index
+        layers = progress(list(tif_filepaths)[:len(col_names)], desc="layers")
+        layer_means = process_layers(
+            layers, geodataframe, nodata_value, cache_dir=zone_cache_dir, resolution=resolution, pyramid_dir=pyramid_dir,
+            raster_cache_dir=raster_cache_dir
+        )
+        for col_name, mean_values in zip(col_names, layer_means):
+            results[col_name] = mean_values
+    else:
+        for tif_path, col_name in progress(list(zip(tif_filepaths, col_names)), desc="layers"):
+            logger.debug("Processing %s for %s", tif_path, col_name)
+
+            # Calculate mean values using zonal stats
+            mean_values = calculate_zonal_stats(
+                tif_path, geodataframe, nodata_value, windowed=windowed, raster_cache_dir=raster_cache_dir
+            )
+
+            # Update results DataFrame
+            results[col_name] = mean_values
+
+    return results
+
+
+def state_shards(geodataframe, shard_by=None):
+    """
+    Split the row positions of the geodataframe into one shard per state
+
+    shard_by: column to shard on, defaults to the state FIPS of the GEOID when present, else the State column
+    """
+    if shard_by is not None:
+        keys = geodataframe[shard_by]
+    elif "GEOID" in geodataframe.columns:
+        keys = geodataframe["GEOID"].astype(str).str[:2]
+    else:
+        keys = geodataframe["State"]
+    positions = pd.Series(range(len(geodataframe)))
+    return list(positions.groupby(keys.to_numpy(), dropna=False).groups.values())
+
+
+@profiled(rows_in=lambda tif_filepaths, bounding_box, *args, **kwargs: len(bounding_box))
+def process_tif_files(tif_filepaths, bounding_box, nodata_value=-9999,bg=False, windowed=False, zone_index=False, workers=None, shard_by=None, zone_cache_dir=None, resolution="native", pyramid_dir=None, raster_cache_dir=None):
+    """
+    Mean of every raster for every polygon of bounding_box, with its County Name and State (and block group codes when bg)
+
+    workers: number of processes, each gets the polygons of one state (see state_shards). Every worker opens the
+        rasters itself, so without raster_cache_dir the default engine is switched to windowed reads (it would decode
+        every full raster once per shard) and the zone index engine decodes the bands it needs once per shard.
+    """
+    x = bounding_box.copy()
 
-    for tif_path, col_name in zip(tif_filepaths, col_names):
-        print(f"Processing {tif_path} for {col_name}")
+    if raster_cache_dir is not None:
+        # decoded once up front, the workers then share the memory-mapped bands
+        cache_rasters(list(tif_filepaths)[:len(col_names)], raster_cache_dir, nodata_value)
 
-        # Calculate mean values using zonal stats
-        mean_values = calculate_zonal_stats(tif_path, x, nodata_value)
+    if resolution != "native" and pyramid_dir is not None:
+        # built once up front instead of in every worker
+        build_pyramids(list(tif_filepaths)[:len(col_names)], pyramid_dir, nodata_value)
 
-        # Update results DataFrame
-        results[col_name] = mean_values
+    if workers is not None and workers > 1:
+        if raster_cache_dir is None and not zone_index and resolution == "native":
+            # only the windows under the polygons of a shard are read instead of the full rasters
+            windowed = True
+        # each worker gets one state of polygons and opens the rasters itself
+        shard_positions = state_shards(x, shard_by)
+        shards = [x.iloc[positions] for positions in shard_positions]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = pool.map(
+                zonal_means_frame, repeat(list(tif_filepaths)), shards, repeat(nodata_value), repeat(windowed), repeat(zone_index),
+                repeat(zone_cache_dir), repeat(resolution), repeat(pyramid_dir),
+                repeat(raster_cache_dir)
+            )
+            parts = [part.set_axis(positions) for part, positions in zip(parts, shard_positions)]
+        # back to the original row order
+        results = pd.concat(parts).sort_index().set_axis(x.index)
+    else:
+        results = zonal_means_frame(
+            tif_filepaths, x, nodata_value, windowed=windowed, zone_index=zone_index, zone_cache_dir=zone_cache_dir,
+            resolution=resolution, pyramid_dir=pyramid_dir, raster_cache_dir=raster_cache_dir
+        )
 
     # Add county and state information
     results["County Name"] = bounding_box["County Name"]
@@ -0,0 +1,256 @@
+import hashlib
+import math
+import os
+
+import numpy as np
+import rasterio
+import shapely
+from rasterio.features import geometry_mask
+from rasterio.windows import Window, from_bounds
+
+from pyramid import cached_pyramid, valid_pixels
+from raster_cache import cached_raster
+
+# Pixels a zone should cover at the pyramid level picked for it with resolution="auto"
+MIN_ZONE_PIXELS = 64
+
+
+def geometry_window(geometry, transform, width, height):
+    """
+    Pixel window of a width x height grid covering the bounds of the geometry (padded by one
+    pixel so that every touched pixel is included), or None if the geometry is outside the grid
+    """
+    window = from_bounds(*geometry.bounds, transform=transform)
+    col_start = max(math.floor(window.col_off) - 1, 0)
+    row_start = max(math.floor(window.row_off) - 1, 0)
+    col_stop = min(math.ceil(window.col_off + window.width) + 1, width)
+    row_stop = min(math.ceil(window.row_off + window.height) + 1, height)
+    if col_stop <= col_start or row_stop <= row_start:
+        return None
+    return Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+
+def build_zone_index(geometries, transform, shape, all_touched=True):
+    """
+    Rasterize every zone once into a sparse pixel -> zone index
+
+    geometries: the zone geometries, already in the raster CRS
+    transform: affine transform of the raster grid
+    shape: (height, width) of the raster grid
+    all_touched: same meaning as in rasterstats.zonal_stats
+
+    Returns (offsets, pixels) in CSR layout: pixels[offsets[i]:offsets[i + 1]] are the flat
+    (row * width + col) indices of the pixels of zone i. Zones may share pixels, as they do
+    in rasterstats.
+    """
+    height, width = shape
+    pixels = []
+    counts = np.zeros(len(geometries), dtype="int64")
+
+    for i, geometry in enumerate(geometries):
+        window = None if geometry is None or geometry.is_empty else geometry_window(geometry, transform, width, height)
+        if window is None:
+            continue
+        inside = geometry_mask(
+            [geometry], out_shape=(window.height, window.width),
+            transform=rasterio.windows.transform(window, transform),
+            all_touched=all_touched, invert=True
+        )
+        rows, cols = np.nonzero(inside)
+        pixels.append((rows + window.row_off).astype("int64") * width + (cols + window.col_off))
+        counts[i] = len(rows)
+
+    offsets = np.zeros(len(geometries) + 1, dtype="int64")
+    np.cumsum(counts, out=offsets[1:])
+    # 32 bit pixel offsets are enough for any grid below 2**31 pixels
+    pixel_dtype = "int32" if height * width < 2**31 else "int64"
+    pixels = np.concatenate(pixels).astype(pixel_dtype) if pixels else np.zeros(0, dtype=pixel_dtype)
+    return offsets, pixels
+
+
+def zone_index_key(geometries, zones_crs, crs, transform, shape, all_touched=True):
+    """
+    Hash identifying a zone index: the zone geometries and their CRS, the raster grid (CRS included) and all_touched
+    """
+    digest = hashlib.sha1()
+    for wkb in shapely.to_wkb(np.asarray(geometries, dtype=object)):
+        digest.update(b"" if wkb is None else wkb)
+    digest.update(repr((str(zones_crs), str(crs), tuple(transform), tuple(shape), bool(all_touched))).encode())
+    return digest.hexdigest()
+
+
+def cached_zone_index(geodataframe, crs, transform, shape, all_touched=True, cache_dir=None):
+    """
+    Zone index of the geodataframe on a raster grid, reused from cache_dir when it was built before
+
+    geodataframe: the zones (in any CRS, they are reprojected to the raster CRS when needed)
+    crs, transform, shape: the raster grid
+    cache_dir: folder holding the cached indexes (no caching when None)
+
+    The index is stored as offsets.npy and pixels.npy in a folder named after zone_index_key and
+    loaded memory-mapped, so worker processes share the same pages.
+    """
+    if cache_dir is not None:
+        key = zone_index_key(geodataframe.geometry.values, geodataframe.crs, crs, transform, shape, all_touched)
+        folder = os.path.join(cache_dir, key)
+        offsets_path = os.path.join(folder, "offsets.npy")
+        pixels_path = os.path.join(folder, "pixels.npy")
+        if os.path.exists(offsets_path) and os.path.exists(pixels_path):
+            return np.load(offsets_path, mmap_mode="r"), np.load(pixels_path, mmap_mode="r")
+
+    zones = geodataframe.to_crs(crs) if geodataframe.crs != crs else geodataframe
+    offsets, pixels = build_zone_index(zones.geometry.values, transform, shape, all_touched)
+
+    if cache_dir is not None:
+        os.makedirs(folder, exist_ok=True)
+        # write under a temporary name first so concurrent runs never read a partial file
+        for path, array in [(pixels_path, pixels), (offsets_path, offsets)]:
+            temp_path = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(temp_path, array)
+            os.replace(temp_path, path)
+    return offsets, pixels
+
+
+def zone_ids(offsets):
+    """
+    Zone number of every entry of the CSR pixel array
+    """
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def _zone_means(ids, sums, counts, n_zones):
+    zone_sums = np.bincount(ids, weights=sums, minlength=n_zones)
+    zone_counts = np.bincount(ids, weights=counts, minlength=n_zones)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = zone_sums / zone_counts
+    return [float(mean) if count else None for mean, count in zip(means, zone_counts)]
+
+
+def zonal_means(array, zone_index, nodata_value):
+    """
+    Mean of the valid pixels of every zone in one vectorized reduction
+
+    array: the raster band (2D, any dtype)
+    zone_index: (offsets, pixels) from build_zone_index on the grid of the array
+    nodata_value: value ignored in the means, along with NaNs and values above 101
+
+    Returns a list with the mean of every zone (None for zones without valid pixels).
+    """
+    offsets, pixels = zone_index
+    values = np.asarray(array).ravel()[pixels].astype("float64")
+    ids = zone_ids(offsets)
+
+    valid = valid_pixels(values, nodata_value)
+    return _zone_means(ids[valid], values[valid], None, len(offsets) - 1)
+
+
+def level_means(level, zone_index):
+    """
+    Mean of the valid native pixels under the blocks of every zone, from a pyramid level (pyramid.Level)
+
+    zone_index: (offsets, pixels) from build_zone_index on the grid of the level
+    """
+    offsets, pixels = zone_index
+    return _zone_means(
+        zone_ids(offsets), np.asarray(level.sums).ravel()[pixels], np.asarray(level.counts).ravel()[pixels],
+        len(offsets) - 1
+    )
+
+
+def zone_levels(geometries, transform, n_levels, min_pixels=MIN_ZONE_PIXELS):
+    """
+    Coarsest pyramid level on which every zone still covers about min_pixels pixels (0 is the native grid)
+
+    geometries: the zone geometries, already in the raster CRS
+    transform: affine transform of the native grid
+    n_levels: number of levels of the pyramid
+    """
+    pixel_area = abs(transform.a * transform.e - transform.b * transform.d)
+    pixels = shapely.area(np.asarray(geometries, dtype=object)) / pixel_area
+    # a level k pixel covers 4**k native pixels
+    with np.errstate(invalid="ignore", divide="ignore"):
+        levels = np.floor(np.log(pixels / min_pixels) / np.log(4))
+    return np.clip(np.nan_to_num(levels, nan=0, posinf=n_levels, neginf=0), 0, n_levels).astype("int64")
+
+
+def zone_groups(geodataframe, crs, transform, shape, levels, resolution, min_pixels, all_touched, cache_dir):
+    """
+    [(level, positions, zone index)] of the zones reduced on every pyramid level (see process_layers)
+
+    levels: the pyramid levels (pyramid.Level) of the raster, empty for resolution="native"
+    """
+    if resolution == "native":
+        zone_level = np.zeros(len(geodataframe), dtype="int64")
+    elif resolution == "auto":
+        zones = geodataframe.to_crs(crs) if geodataframe.crs != crs else geodataframe
+        zone_level = zone_levels(zones.geometry.values, transform, len(levels), min_pixels)
+    elif 0 <= resolution <= len(levels):
+        zone_level = np.full(len(geodataframe), resolution, dtype="int64")
+    else:
+        raise ValueError(f"resolution {resolution} is above the {len(levels)} levels of the pyramid")
+
+    groups = []
+    for level in np.unique(zone_level):
+        positions = np.flatnonzero(zone_level == level)
+        zones = geodataframe if len(positions) == len(geodataframe) else geodataframe.iloc[positions]
+        level_transform, level_shape = (transform, shape) if level == 0 else levels[level - 1][1:3]
+        groups.append((
+            int(level), positions,
+            cached_zone_index(zones, crs, level_transform, level_shape, all_touched, cache_dir),
+        ))
+    return groups
+
+
+def process_layers(
+    tif_filepaths, geodataframe, nodata_value, all_touched=True, cache_dir=None, resolution="native", pyramid_dir=None,
+    min_pixels=MIN_ZONE_PIXELS, raster_cache_dir=None
+):
+    """
+    Zonal means of several rasters, rasterizing the zones only once per raster grid
+
+    tif_filepaths: paths to the rasters
+    geodataframe: the zones
+    nodata_value: value ignored in the means (see zonal_means)
+    cache_dir: folder to persist the zone indexes in (see cached_zone_index)
+    resolution: "native" reduces the full rasters, an integer k reduces every zone on pyramid level k
+        (blocks of 2**k x 2**k pixels) and "auto" picks for every zone the coarsest level on which it
+        still covers min_pixels pixels, so counties use coarse levels and block groups the native grid
+    pyramid_dir: folder the pyramids are built in and read from (see pyramid.cached_pyramid), needed
+        unless resolution is "native"
+    raster_cache_dir: folder of the decoded rasters (see raster_cache.cached_raster), the native bands are
+        memory-mapped from there instead of decompressed again
+
+    Means from pyramid levels are exact means of the native pixels under the blocks a zone touches,
+    so they only differ from native means along the zone borders.
+    Returns a list with the zone means of every raster, in the order of tif_filepaths.
+    """
+    if resolution != "native" and pyramid_dir is None:
+        raise ValueError(f"resolution {resolution!r} needs a pyramid_dir")
+
+    indexes = {}
+    layers = []
+    for tif_path in tif_filepaths:
+        levels = [] if resolution == "native" else cached_pyramid(tif_path, pyramid_dir, nodata_value)
+        with rasterio.open(tif_path) as src:
+            grid = (src.crs.to_string() if src.crs else None, tuple(src.transform), src.shape)
+            if grid not in indexes:
+                indexes[grid] = zone_groups(
+                    geodataframe, src.crs, src.transform, src.shape, levels, resolution, min_pixels, all_touched,
+                    cache_dir
+                )
+            # the native band is only read when some zone is reduced on it
+            array = None
+            if any(level == 0 for level, _, _ in indexes[grid]):
+                array = src.read(1) if raster_cache_dir is None else cached_raster(
+                    tif_path, raster_cache_dir, nodata_value
+                ).array
+
+        means = [None] * len(geodataframe)
+        for level, positions, zone_index in indexes[grid]:
+            level_values = zonal_means(array, zone_index, nodata_value) if level == 0 else level_means(
+                levels[level - 1], zone_index
+            )
+            for position, mean in zip(positions, level_values):
+                means[position] = mean
+        layers.append(means)
+    return layers
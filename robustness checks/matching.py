@@ -0,0 +1,211 @@
+"""
+Matching engine of the project robustness checks
+
+The counties (or block groups) are ranked on every suitability factor once and the projects are joined
+to them on integer keys once, so the top or bottom N matches of any factor, project size and level are
+slices of precomputed arrays instead of a sort and a string keyed merge per query.
+
+    counties = match_index(suitability_county, suitability_proj, FIPS, level="county")
+    top_matches(counties, "GHI", 10, ascending=False, project_size="large")
+    match_grid([counties], [5, 10, 25])
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+FACTORS = ['GHI', 'Protected_Land', 'Habitat', 'Slope', 'Population_Density', 'Distance_to_Substation', 'Land_Cover']
+
+# Project sizes: small below 5 MW, medium from 5 to 25 MW, large from 25 MW
+PROJECT_SIZES = ["all", "small", "medium", "large"]
+PROJECT_SIZE_EDGES = [5, 25]
+
+# Suffix of the factor columns of the county / block group a project is matched to
+LEVEL_SUFFIX = {"county": "_county", "bg": "_bg"}
+
+# level: "county" or "bg"; factors: the ranked factors; zones: the counties / block groups with their factors;
+# projects: the projects joined to a zone, with their State and County Name;
+# matched: {(factor, ascending, project size): (zone positions, ranks)} of the zones with projects, best first;
+# by_zone: {(factor, project size): (offsets, rows)}, rows[offsets[z]:offsets[z + 1]] are the projects of zone z
+MatchIndex = namedtuple("MatchIndex", ["level", "factors", "zones", "projects", "matched", "by_zone"])
+
+
+#### Keys #####
+def county_key(state_fips, county_fips):
+    """
+    Integer county key (state FIPS * 1000 + county FIPS) of FIPS codes stored as strings or numbers
+    """
+    return pd.to_numeric(state_fips, errors="coerce") * 1000 + pd.to_numeric(county_fips, errors="coerce")
+
+
+def zone_table(suitability, fips, level, factors):
+    """
+    Counties or block groups with their integer key, without the rows missing a name, key or factor
+    """
+    if level == "county":
+        zones = suitability.drop(columns=["FIPS State", "FIPS County"], errors="ignore").merge(
+            fips, on=["State", "County Name"], how="left"
+        )
+        zones["key"] = county_key(zones["FIPS State"], zones["FIPS County"])
+        columns = ["State", "County Name", "key"] + factors
+    elif level == "bg":
+        zones = suitability.assign(key=pd.to_numeric(suitability["GEOID"], errors="coerce"))
+        columns = ["State", "County Name", "GEOID", "key"] + factors
+    else:
+        raise ValueError(f"Invalid project level: {level}")
+    zones = zones[columns].dropna().reset_index(drop=True)
+    return zones.astype({"key": "int64"})
+
+
+def project_table(projects, fips, level, factors):
+    """
+    Projects with their integer zone key, size class and the State and County Name of their county
+    """
+    counties = fips.assign(county=county_key(fips["FIPS State"], fips["FIPS County"]))
+    counties = counties.dropna(subset=["county"]).drop_duplicates("county")[["county", "State", "County Name"]]
+
+    projects = projects.drop(columns=["State", "County Name"], errors="ignore")
+    projects = projects.assign(county=county_key(projects["STATEFP"], projects["COUNTYFP"]))
+    projects["key"] = projects["county"] if level == "county" else pd.to_numeric(projects["GEOID"], errors="coerce")
+    projects = projects.merge(counties, on="county", how="left")
+    projects["size"] = pd.cut(
+        projects["Wattage"], [-np.inf] + PROJECT_SIZE_EDGES + [np.inf], labels=PROJECT_SIZES[1:], right=False
+    )
+    projects = projects.dropna(subset=["key"]).reset_index(drop=True)
+    return projects[["State", "County Name", "GEOID", "Wattage", "key", "size"] + factors].astype({"key": "int64"})
+
+
+#### Index #####
+def match_index(suitability, projects, fips, level="county", factors=FACTORS):
+    """
+    Rank the zones of a level on every factor and join the projects to them
+
+    suitability: county (State, County Name) or block group (State, County Name, GEOID) suitability scores
+    projects: project suitability scores with Wattage, GEOID, STATEFP and COUNTYFP
+    fips: the FIPS table (State, County Name, FIPS State, FIPS County)
+    level: "county" or "bg"
+
+    Within a county the projects are ordered on the factor, within a block group they keep their order.
+    """
+    factors = list(factors)
+    zones = zone_table(suitability, fips, level, factors)
+    projects = project_table(projects, fips, level, factors)
+
+    # every (project, zone) pair sharing a key, zones appearing twice get the projects twice
+    pairs = projects[["key"]].reset_index(names="project").merge(
+        pd.DataFrame({"key": zones["key"], "zone": np.arange(len(zones))}), on="key"
+    )
+    pair_projects = pairs["project"].to_numpy()
+    pair_zones = pairs["zone"].to_numpy()
+    pair_sizes = projects["size"].to_numpy()[pair_projects]
+    in_size = {size: np.ones(len(pairs), dtype=bool) if size == "all" else pair_sizes == size for size in PROJECT_SIZES}
+    projects = projects.drop(columns=["key", "size"])
+
+    matched, by_zone = {}, {}
+    for factor in factors:
+        within = projects[factor].to_numpy()[pair_projects] if level == "county" else pair_projects
+        sorted_pairs = np.lexsort((pair_projects, within, pair_zones))
+
+        values = zones[factor].to_numpy()
+        orders = {True: np.argsort(values, kind="stable"), False: np.argsort(-values, kind="stable")}
+        for size in PROJECT_SIZES:
+            selected = sorted_pairs[in_size[size][sorted_pairs]]
+            offsets = np.zeros(len(zones) + 1, dtype="int64")
+            np.cumsum(np.bincount(pair_zones[selected], minlength=len(zones)), out=offsets[1:])
+            by_zone[(factor, size)] = (offsets, pair_projects[selected])
+
+            has_projects = np.diff(offsets) > 0
+            for ascending, order in orders.items():
+                # ranks count every zone, with or without projects
+                ranks = np.flatnonzero(has_projects[order]) + 1
+                matched[(factor, ascending, size)] = (order[ranks - 1], ranks)
+
+    return MatchIndex(level, factors, zones, projects, matched, by_zone)
+
+
+#### Queries #####
+def _matches(index, factor, n, ascending, project_size):
+    """
+    (project rows, zone positions, zone ranks, projects per zone) of the first n zones with projects
+    """
+    if (factor, ascending, project_size) not in index.matched:
+        raise ValueError(f"Invalid factor or project size: {factor}, {project_size}")
+    zones, ranks = index.matched[(factor, ascending, project_size)]
+    zones, ranks = zones[:n], ranks[:n]
+    offsets, rows = index.by_zone[(factor, project_size)]
+    starts = offsets[zones]
+    lengths = offsets[zones + 1] - starts
+    # position in rows of every project of the zones, zone after zone
+    take = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    return rows[take], np.repeat(zones, lengths), np.repeat(ranks, lengths), lengths
+
+
+def _match_frame(index, project_rows, zone_rows, ranks, suffix, rank_column):
+    projects = index.projects
+    columns = {
+        "State": projects["State"].to_numpy()[project_rows],
+        "County Name": projects["County Name"].to_numpy()[project_rows],
+        "GEOID": projects["GEOID"].to_numpy()[project_rows],
+        rank_column: ranks,
+        "Wattage": projects["Wattage"].to_numpy()[project_rows],
+    }
+    for factor in index.factors:
+        columns[factor] = projects[factor].to_numpy()[project_rows]
+        columns[factor + suffix] = index.zones[factor].to_numpy()[zone_rows]
+    return pd.DataFrame(columns)
+
+
+def top_matches(index, factor, n, ascending=True, project_size="all"):
+    """
+    Projects of the first n counties / block groups with projects, ranked on a factor
+
+    index: MatchIndex from match_index
+    n: number of zones with projects to return (a zone brings all its projects)
+    ascending: rank the zones from the lowest factor value (bottom N) or from the highest (top N)
+    project_size: "all", "small", "medium" or "large"
+
+    Returns one row per project with its State, County Name, GEOID, the County Rank of its zone,
+    Wattage and every factor next to the factor of its zone (suffixed _county or _bg).
+    """
+    project_rows, zone_rows, ranks, _ = _matches(index, factor, n, ascending, project_size)
+    return _match_frame(index, project_rows, zone_rows, ranks, LEVEL_SUFFIX[index.level], "County Rank")
+
+
+def match_grid(indexes, ns, factors=None, project_sizes=PROJECT_SIZES, ascending=(True, False)):
+    """
+    Matches of every level x factor x project size x direction x N as one table
+
+    indexes: MatchIndex of every level
+    ns: the numbers of matched zones (e.g. [5, 10, 25]), every N is a prefix of the largest one
+
+    Returns the rows of top_matches preceded by Level, Factor, Project Size, Ascending and N columns.
+    The rank column is named Rank and the factors of the zones are suffixed _level, so both levels fit
+    in the same columns.
+    """
+    frames = []
+    for index in indexes:
+        parts = []
+        for factor in factors or index.factors:
+            for size in project_sizes:
+                for direction in ascending:
+                    project_rows, zone_rows, ranks, lengths = _matches(index, factor, max(ns), direction, size)
+                    stops = np.concatenate([[0], np.cumsum(lengths)])
+                    for n in ns:
+                        stop = stops[min(n, len(lengths))]
+                        parts.append((factor, size, direction, n, project_rows[:stop], zone_rows[:stop], ranks[:stop]))
+        if not parts:
+            continue
+
+        counts = [len(part[4]) for part in parts]
+        frame = _match_frame(
+            index, *(np.concatenate([part[i] for part in parts]) for i in (4, 5, 6)), "_level", "Rank"
+        )
+        keys = pd.DataFrame({
+            "Level": index.level,
+            "Factor": np.repeat([part[0] for part in parts], counts),
+            "Project Size": np.repeat([part[1] for part in parts], counts),
+            "Ascending": np.repeat([part[2] for part in parts], counts).astype(bool),
+            "N": np.repeat([part[3] for part in parts], counts).astype("int64"),
+        }, index=frame.index)
+        frames.append(pd.concat([keys, frame], axis=1))
+    return pd.concat(frames, ignore_index=True)